@@ -1,29 +1,327 @@
-import requests_cache
-from requests_cache import CachedSession
+import asyncio
+import copy
+import json
+import time
 import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from logging import getLogger
 
+from app import metrics, settings
+from app.aiven import client, persistence
+
 
 logger = getLogger("cache")
 
+_upstream_versions = ContextVar("upstream_versions", default=None)
+
+counters = {"coalesced": 0}    # Upstream calls saved by sharing an identical call already in flight
+
+
+@contextmanager
+def track_versions():
+    """
+    Collects the payload versions of all upstream responses used inside the block, including concurrent tasks
+    started from it. Used to derive ETags.
+    """
+    versions = []
+    reset_token = _upstream_versions.set(versions)
+    try:
+        yield versions
+    finally:
+        _upstream_versions.reset(reset_token)
+
+
+def _record_version(response):
+    versions = _upstream_versions.get()
+    if versions is not None and response:
+        versions.append(response.version)
+
+
+class CachedResponse:
+    """
+    Upstream response detached from the connection, safe to keep in the cache and share between requests.
+    """
+
+    def __init__(self, status_code, headers, content, created_at=None):
+        self.status_code = status_code
+        self.headers = {key.lower(): value for key, value in headers.items()}
+        self.content = content
+        self.version = hashlib.sha1(content).hexdigest()    # Identifies the payload, changes when upstream data does
+        self.created_at = created_at or time.time()
+        self.from_cache = False
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def __bool__(self):
+        return self.ok
+
+    def json(self):
+        return json.loads(self.content)
+
+    def cached_copy(self):
+        response = copy.copy(self)
+        response.from_cache = True
+        return response
+
+    def revalidated(self, headers):
+        """Copy of this response, fresh again after upstream answered 304 Not Modified"""
+        response = copy.copy(self)
+        response.headers = {**self.headers, **{key.lower(): value for key, value in headers.items()}}
+        response.created_at = time.time()
+        return response
+
+    def conditional_headers(self):
+        headers = {}
+        if self.headers.get("etag"):
+            headers["If-None-Match"] = self.headers["etag"]
+        if self.headers.get("last-modified"):
+            headers["If-Modified-Since"] = self.headers["last-modified"]
+        return headers
+
+
+class CachedSession:
+    """
+    Async replacement for requests_cache.CachedSession. Successful GET responses are kept per url,
+    forever or for expire_after seconds.
+
+    Responses older than stale_after are still served from the cache, on_stale(url) is called so the owner can
+    refresh them in the background.
+
+    With a persistent store, responses are written through to it (encoded with the codec) and read from it when
+    they are not in memory.
+    """
+
+    def __init__(self, name, expire_after=None, on_resize=None, stale_after=None, on_stale=None, label="private",
+                 store=None, codec=None):
+        self.name = name
+        self.store = store
+        self.codec = codec
+        self.label = label    # Cache label of the metrics
+        self.expire_after = expire_after
+        self.stale_after = stale_after
+        self.on_stale = on_stale
+        self.responses = {}
+        self.size = 0    # Bytes of cached response bodies
+        self.on_resize = on_resize
+        self.evicted = False
+        self.in_flight = {}    # url -> task of the upstream call
+
+    def _is_expired(self, response):
+        return self.expire_after is not None and time.time() - response.created_at > self.expire_after
+
+    def _is_stale(self, response):
+        return self.stale_after is not None and time.time() - response.created_at > self.stale_after
+
+    async def get(self, url, headers=None, timeout=None):
+        cached = self.responses.get(url)
+        if cached is None and self.store is not None:
+            cached = await self._load(url)
+        hit = cached is not None and not self._is_expired(cached)
+        metrics.observe_cache(self.label, hit)
+        if hit:
+            if self.on_stale is not None and self._is_stale(cached):
+                self.on_stale(url)
+            response = cached.cached_copy()
+        else:
+            response = await self.fetch(url, headers=headers, timeout=timeout)
+        _record_version(response)
+        return response
+
+    def has_fresh(self, url):
+        """True when get(url) would be answered from memory without going upstream"""
+        cached = self.responses.get(url)
+        return cached is not None and not self._is_expired(cached)
+
+    async def fetch(self, url, headers=None, timeout=None):
+        """
+        Always goes upstream, revalidating the cached response if there is one. A successful response replaces
+        the cached one, otherwise the cached one is kept.
+
+        Concurrent fetches of the same url share one upstream call and get the same result. The call is not
+        cancelled when one of the callers is.
+        """
+        task = self.in_flight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(url, headers=headers, timeout=timeout))
+            self.in_flight[url] = task
+            task.add_done_callback(lambda done: self._fetched(url, done))
+        else:
+            counters["coalesced"] += 1
+            metrics.observe_coalesced(self.label)
+        response = await asyncio.shield(task)
+        return copy.copy(response)
+
+    def _fetched(self, url, task):
+        if self.in_flight.get(url) is task:
+            del self.in_flight[url]
+        if not task.cancelled():
+            task.exception()    # Retrieved here in case every caller was cancelled
 
-session = CachedSession('shared_cache', backend='memory')
-private_sessions = {}    # Way too simple session cache
+    async def _fetch(self, url, headers=None, timeout=None):
+        cached = self.responses.get(url)
+        if cached is not None:
+            headers = {**(headers or {}), **cached.conditional_headers()}
+        upstream = await client.get(url, headers=headers, timeout=timeout)
+        if upstream.status_code == 304 and cached is not None:
+            response = cached.revalidated(upstream.headers)
+            self.responses[url] = response
+            await self._persist(url, response)
+            return response.cached_copy()
+        response = CachedResponse(upstream.status_code, upstream.headers, upstream.content)
+        if response.status_code == 200:
+            self._store(url, response)
+            await self._persist(url, response)
+        return response
+
+    async def _load(self, url):
+        try:
+            record = await asyncio.to_thread(self._load_sync, url)
+        except Exception as e:
+            logger.warning(f"Reading persisted response failed: {e}")
+            return None
+        if record is None:
+            return None
+        if url not in self.responses:    # Unless a fetch finished meanwhile
+            self._store(url, CachedResponse(*record))
+        return self.responses[url]
+
+    def _load_sync(self, url):
+        payload = self.store.load(self.codec.namespace, self.codec.url_key(url))
+        if payload is not None:
+            payload = self.codec.decode(payload)
+        if payload is None:
+            return None
+        return persistence.unpack(payload)
+
+    async def _persist(self, url, response):
+        if self.store is None:
+            return
+        try:
+            await asyncio.to_thread(self._persist_sync, url, response)
+        except Exception as e:
+            logger.warning(f"Persisting response failed: {e}")
+
+    def _persist_sync(self, url, response):
+        payload = self.codec.encode(persistence.pack(response))
+        self.store.save(self.codec.namespace, self.codec.url_key(url), response.created_at, payload)
+
+    def _store(self, url, response):
+        previous = self.responses.get(url)
+        self.responses[url] = response
+        self._resize(len(response.content) - (len(previous.content) if previous is not None else 0))
+
+    def _resize(self, delta):
+        self.size += delta
+        if self.on_resize is not None and delta:
+            self.on_resize(delta)
+
+    def remove_expired(self):
+        for url in [url for url, response in self.responses.items() if self._is_expired(response)]:
+            response = self.responses.pop(url)
+            self._resize(-len(response.content))
+
+    def clear(self):
+        self.responses = {}
+        self._resize(-self.size)
+
+    def response_count(self):
+        return len(self.responses)
+
+
+class SessionStore:
+    """
+    Private sessions in LRU order. Sessions are evicted when idle for longer than idle_timeout, when there are more
+    than max_sessions of them, or when the cached responses of all sessions together take more than max_bytes.
+    """
+
+    def __init__(self, max_sessions, idle_timeout, max_bytes):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self.sessions = OrderedDict()    # key -> (session, last used timestamp), least recently used first
+        self.bytes = 0
+        self.evictions = {"idle": 0, "lru": 0, "bytes": 0}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, key):
+        return key in self.sessions
+
+    def values(self):
+        return [session for session, _ in self.sessions.values()]
+
+    def get(self, key, token):
+        now = time.time()
+        self._evict_idle(now)
+        if key in self.sessions:
+            session, _ = self.sessions.pop(key)
+        else:
+            logger.warning(f"Creating cached session for hash {key}")
+            store = persistence.get_store()
+            codec = persistence.TokenCodec(key, token) if store is not None else None
+            session = CachedSession(key, expire_after=60, on_resize=self._resized, store=store, codec=codec)
+        self.sessions[key] = (session, now)
+        while len(self.sessions) > self.max_sessions:
+            self._evict_oldest("lru")
+        return session
+
+    def _resized(self, delta):
+        self.bytes += delta
+        if delta > 0 and self.bytes > self.max_bytes:
+            self._enforce_byte_budget()
+
+    def _enforce_byte_budget(self):
+        for session in self.values():
+            session.remove_expired()
+        # The most recently used session is the one being filled right now, it is never evicted for bytes
+        while self.bytes > self.max_bytes and len(self.sessions) > 1:
+            self._evict_oldest("bytes")
+
+    def _evict_idle(self, now):
+        while self.sessions:
+            _, last_used = next(iter(self.sessions.values()))
+            if now - last_used <= self.idle_timeout:
+                break
+            self._evict_oldest("idle")
+
+    def _evict_oldest(self, reason):
+        key, (session, _) = self.sessions.popitem(last=False)
+        logger.info(f"Evicting cached session for hash {key} ({reason})")
+        session.clear()
+        session.on_resize = None    # Requests still holding the session no longer count against the budget
+        session.evicted = True
+        self.evictions[reason] += 1
+
+
+session = CachedSession(
+    'shared_cache', stale_after=settings.CATALOG_MAX_AGE, label="shared",
+    store=persistence.get_store(), codec=persistence.PlainCodec(),
+)
+private_sessions = SessionStore(
+    max_sessions=settings.PRIVATE_CACHE_MAX_SESSIONS,
+    idle_timeout=settings.PRIVATE_CACHE_IDLE_TIMEOUT,
+    max_bytes=settings.PRIVATE_CACHE_MAX_BYTES,
+)
+metrics.track_cache_bytes("shared", lambda: session.size)
+metrics.track_cache_bytes("private", lambda: private_sessions.bytes)
 
 
 def get_shared_session():
     return session
 
 
+def token_hash(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
 def get_private_session(token):
     print(f"TOKEN : [{token[:15]}***********]")
-    key = hashlib.sha256(token.encode('utf-8')).hexdigest()
-    if key in private_sessions:
-        return private_sessions[key]
-    else:
-        logger.warn(f"Creating cached session for hash {key}")
-        private_sessions[key] = CachedSession(key, backend="memory", expire_after=60)
-        return private_sessions[key]
+    return private_sessions.get(token_hash(token), token)
 
 
 def get_cache_session_count():
@@ -31,8 +329,15 @@ def get_cache_session_count():
 
 def get_cache_response_count():
     counter = 0
-    for key in private_sessions.keys():
-        session = private_sessions[key]
-        counter = counter + session.cache.response_count()
+    for session in private_sessions.values():
+        counter = counter + session.response_count()
     return counter
 
+def get_cache_bytes():
+    return private_sessions.bytes
+
+def get_cache_evictions():
+    return dict(private_sessions.evictions)
+
+def get_coalesced_count():
+    return counters["coalesced"]
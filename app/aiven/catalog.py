@@ -0,0 +1,258 @@
+"""
+Parsed and indexed /v1/service_types and /v1/service_versions payloads. Built once per upstream payload version
+and shared by all requests, so the catalog endpoints only do dict lookups.
+"""
+import sys
+from collections import OrderedDict
+from datetime import datetime
+
+from app import paging
+from app.aiven import filters, pricing
+
+
+REGION_ORDER_FIELDS = ("disk_space_mb", "node_memory_mb", "price_usd")
+REGION_FIELDS = ("id",) + REGION_ORDER_FIELDS    # id is the region name
+
+
+def parse_fields(fields, allowed):
+    """
+    Field names of a fields= parameter ("price_usd,node_memory_mb"), in the order of allowed. None when all fields
+    are wanted. Raises ValueError on unknown fields.
+    """
+    if fields is None:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields {', '.join(sorted(unknown))}, available: {', '.join(allowed)}")
+    return tuple(field for field in allowed if field in requested)
+
+
+class Compactor:
+    """
+    Copies a decoded JSON document into a compact form: strings are interned, and dicts of plain values (region
+    attributes, backup configs) that are equal, value types included, are stored once and shared. The result must
+    not be modified.
+    raw_bytes is the size of the documents as decoded.
+    """
+
+    def __init__(self):
+        self.shared = {}    # items of a dict of plain values -> the one copy kept
+        self.raw_bytes = 0
+        self._seen = set()    # ids of the decoded objects counted in raw_bytes
+
+    def compact(self, value):
+        if id(value) not in self._seen:
+            self._seen.add(id(value))
+            self.raw_bytes += sys.getsizeof(value)
+        if isinstance(value, str):
+            return sys.intern(value)
+        if isinstance(value, list):
+            return [self.compact(item) for item in value]
+        if isinstance(value, dict):
+            items = tuple((self.compact(key), self.compact(item)) for key, item in value.items())
+            if any(isinstance(item, (dict, list)) for _, item in items):
+                return dict(items)
+            # 1, 1.0 and True are equal but serialize differently
+            key = tuple((name, type(item), item) for name, item in items)
+            compacted = self.shared.get(key)
+            if compacted is None:
+                compacted = self.shared[key] = dict(items)
+            return compacted
+        return value
+
+
+def deep_size(value, seen=None):
+    """Bytes of a JSON-like structure, objects shared within it counted once"""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, list):
+        size += sum(deep_size(item, seen) for item in value)
+    return size
+
+
+class ServicePlan:
+    __slots__ = ("name", "data", "regions", "_region_index", "_region_columns", "_projections")
+
+    MAX_PROJECTIONS = 8    # field sets remembered per plan
+
+    def __init__(self, data):
+        self.name = data.get("service_plan")
+        self.data = data
+        self.regions = data.get("regions", {})
+        self._region_index = None
+        self._region_columns = {}    # field -> {region: value}
+        self._projections = OrderedDict()    # (kind, fields) -> projected data, least recently used first
+
+    @property
+    def region_index(self):
+        """Region names sorted by every field regions can be ordered by, built on first use"""
+        if self._region_index is None:
+            self._region_index = paging.SortedKeys(self.regions, REGION_ORDER_FIELDS)
+        return self._region_index
+
+    def region_column(self, field):
+        """Value of one field for every region, built on first use"""
+        column = self._region_columns.get(field)
+        if column is None:
+            if field == "id":
+                column = {region: region for region in self.regions}
+            else:
+                column = {region: attributes.get(field) for region, attributes in self.regions.items()}
+            self._region_columns[field] = column
+        return column
+
+    def projected_regions(self, fields):
+        """Regions with only the given fields (see parse_fields), all of them for None"""
+        if fields is None:
+            return self.regions
+        return self._projection(("regions", fields), lambda: self._project_regions(fields))
+
+    def projected(self, fields):
+        """Plan attributes limited to the given fields, all of them for None"""
+        if fields is None:
+            return self.data
+        return self._projection(("plan", fields), lambda: {field: self.data[field] for field in fields})
+
+    def _project_regions(self, fields):
+        columns = [(field, self.region_column(field)) for field in fields]
+        return {region: {field: column[region] for field, column in columns} for region in self.regions}
+
+    def _projection(self, key, build):
+        projection = self._projections.get(key)
+        if projection is None:
+            projection = self._projections[key] = build()
+            if len(self._projections) > self.MAX_PROJECTIONS:
+                self._projections.popitem(last=False)
+        else:
+            self._projections.move_to_end(key)
+        return projection
+
+
+class ServiceTypeEntry:
+    __slots__ = ("name", "data", "plans", "_filter_index")
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        # Upstream order of plans is kept, it goes from the smallest to the largest plan
+        self.plans = {plan.get("service_plan"): ServicePlan(plan) for plan in data.get("service_plans", [])}
+        self._filter_index = None
+
+    @property
+    def filter_index(self):
+        """Plans and regions indexed for filter expressions, built on first use"""
+        if self._filter_index is None:
+            self._filter_index = filters.FilterIndex(self.plans, REGION_ORDER_FIELDS)
+        return self._filter_index
+
+
+class ServiceCatalog:
+    def __init__(self, data, version):
+        self.version = version
+        compactor = Compactor()
+        data = compactor.compact(data)
+        self.raw_bytes = compactor.raw_bytes
+        self.shared_objects = len(compactor.shared)
+        self.service_types = {
+            name: ServiceTypeEntry(name, properties) for name, properties in data.get("service_types", {}).items()
+        }
+        self.pricing = pricing.PricingTable(self.service_types)
+        self._nbytes = None
+
+    @property
+    def nbytes(self):
+        """Bytes of the compacted payload kept by the catalog, computed on first use"""
+        if self._nbytes is None:
+            seen = set()
+            self._nbytes = sum(deep_size(entry.data, seen) for entry in self.service_types.values())
+        return self._nbytes
+
+    def get_service_type(self, service_type):
+        return self.service_types.get(service_type)
+
+    def get_plan(self, service_type, plan):
+        entry = self.service_types.get(service_type)
+        if entry is None:
+            return None
+        return entry.plans.get(plan)
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _version_sort_key(major_version):
+    return tuple((0, int(part), "") if part.isdigit() else (1, 0, part) for part in str(major_version).split("."))
+
+
+class ServiceVersion:
+    def __init__(self, data):
+        self.service_type = data.get("service_type")
+        self.major_version = data.get("major_version")
+        self.state = data.get("state")
+        self.availability_start = _parse_time(data.get("availability_start_time"))
+        self.availability_end = _parse_time(data.get("availability_end_time"))
+        self.aiven_end_of_life = _parse_time(data.get("aiven_end_of_life_time"))
+        self.projection = {
+            "state": self.state,
+            "lifecycle": {
+                "upstream_end_of_life_time": data.get("upstream_end_of_life_time"),
+                "aiven_end_of_life_time": data.get("aiven_end_of_life_time"),
+                "aiven_availability_end_time": data.get("availability_end_time"),
+                "aiven_availability_start_time": data.get("availability_start_time"),
+                "aiven_end_of_life_help_article_url": data.get("end_of_life_help_article_url"),
+                "aiven_termination_time": data.get("termination_time"),
+            }
+        }
+
+    def is_available(self, at):
+        if self.availability_start is not None and at < self.availability_start:
+            return False
+        if self.availability_end is not None and at >= self.availability_end:
+            return False
+        return True
+
+    def is_end_of_life_before(self, date):
+        return self.aiven_end_of_life is not None and self.aiven_end_of_life.date() < date
+
+
+class VersionIndex:
+    """
+    Parsed /v1/service_versions payload, grouped by service type and ordered by major version.
+    """
+
+    def __init__(self, data, version):
+        self.version = version
+        self.versions = data.get("service_versions", [])
+        by_type = {}
+        for item in self.versions:
+            service_version = ServiceVersion(item)
+            by_type.setdefault(service_version.service_type, []).append(service_version)
+        self.by_type = {
+            service_type: sorted(versions, key=lambda v: _version_sort_key(v.major_version))
+            for service_type, versions in by_type.items()
+        }
+
+    def find(self, service_type, available_at=None, eol_before=None):
+        """
+        Versions of the service type: major version -> lifecycle projection. available_at (a datetime) keeps
+        versions available at that time, eol_before (a date) those reaching Aiven end of life before it.
+        """
+        versions = self.by_type.get(service_type, [])
+        if available_at is not None:
+            versions = [v for v in versions if v.is_available(available_at)]
+        if eol_before is not None:
+            versions = [v for v in versions if v.is_end_of_life_before(eol_before)]
+        return {v.major_version: v.projection for v in versions}
@@ -0,0 +1,111 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+from logging import getLogger
+
+from app import metrics, settings
+from app.aiven import scheduler as _scheduler
+
+
+logger = getLogger("client")
+
+
+_client = None    # Shared by all sessions so keep-alive connections are reused
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.UPSTREAM_TIMEOUT, connect=settings.UPSTREAM_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+def _retry_after(response):
+    """Seconds the Retry-After header of the response asks to wait, None without one"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    """Full jitter: anything up to the exponential backoff of the attempt"""
+    return random.uniform(0, settings.UPSTREAM_RETRY_BACKOFF * 2 ** attempt)
+
+
+async def _send(url, headers, timeout):
+    start = time.perf_counter()
+    try:
+        if timeout is None:
+            response = await get_client().get(url, headers=headers)
+        else:
+            response = await get_client().get(url, headers=headers, timeout=timeout)
+    except Exception as e:
+        metrics.observe_upstream(url, type(e).__name__, time.perf_counter() - start)
+        raise
+    metrics.observe_upstream(url, response.status_code, time.perf_counter() - start)
+    return response
+
+
+async def get(url, headers=None, timeout=None):
+    """
+    GET the url with the pooled client, within the rate limits of the scheduler and at the priority of the caller.
+    429 and 5xx gateway responses and connection errors are retried. Timeout (seconds) overrides the default for
+    each attempt of this call only.
+    """
+    key = _scheduler.token_key(headers)
+    priority = _scheduler.current_priority()
+    attempt = 0
+    while True:
+        await _scheduler.scheduler.acquire(key, priority)
+        try:
+            response = await _send(url, headers, timeout)
+        except httpx.ConnectError:
+            if attempt >= settings.UPSTREAM_MAX_RETRIES:
+                raise
+            metrics.observe_retry(url, "connect")
+            await asyncio.sleep(_backoff(attempt))
+            attempt += 1
+            continue
+        if response.status_code not in RETRY_STATUSES:
+            return response
+        wait = _retry_after(response)
+        if response.status_code == 429 and wait is not None:
+            _scheduler.scheduler.retry_after(key, wait)
+        if attempt >= settings.UPSTREAM_MAX_RETRIES or (wait is not None and wait > settings.UPSTREAM_MAX_RETRY_WAIT):
+            return response
+        metrics.observe_retry(url, response.status_code)
+        if wait is None:
+            await asyncio.sleep(_backoff(attempt))
+        elif response.status_code != 429:
+            await asyncio.sleep(wait)
+        # After a 429 the scheduler holds the next attempt until Retry-After has passed
+        attempt += 1
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,162 @@
+"""
+Filter expressions over the plans and regions of a service type, eg.
+
+    cloud=aws|google,price_usd<0.05,node_memory_mb>=4096
+
+Clauses are separated by commas and must all hold for the same plan in the same region. A clause is a field, an
+operator and a value; alternatives of a value are separated by '|'.
+
+    cloud, region, plan                     =, != or ~ (contains)
+    disk_space_mb, node_memory_mb,          =, !=, <, <=, > or >=
+    price_usd, node_count, max_memory_percent
+
+The (plan, region) rows of a service type are indexed once per catalog version: an inverted index from every value
+of the string fields to its rows, and the rows sorted by every numeric field. A clause is then a lookup or a
+bisected slice, and an expression the intersection of the clauses' rows.
+"""
+import math
+import re
+from bisect import bisect_left, bisect_right
+
+
+STRING_FIELDS = ("cloud", "region", "plan")
+PLAN_NUMERIC_FIELDS = ("node_count", "max_memory_percent")
+STRING_OPERATORS = ("=", "!=", "~")
+NUMERIC_OPERATORS = ("=", "!=", "<", "<=", ">", ">=")
+
+_CLAUSE = re.compile(r"^\s*([a-z_]+)\s*(<=|>=|!=|=|<|>|~)\s*(.+?)\s*$")
+
+
+class Clause:
+    def __init__(self, field, operator, values):
+        self.field = field
+        self.operator = operator
+        self.values = values
+
+
+def parse(expression, numeric_fields):
+    """
+    Clauses of the expression. Raises ValueError on syntax errors, unknown fields and operators that do not apply
+    to the field.
+    """
+    clauses = []
+    for part in expression.split(","):
+        if not part.strip():
+            continue
+        match = _CLAUSE.match(part)
+        if match is None:
+            raise ValueError(f"Invalid filter clause '{part.strip()}', expected eg. price_usd<0.1")
+        field, operator, value = match.groups()
+        values = [value.strip() for value in value.split("|") if value.strip()]
+        if field in STRING_FIELDS:
+            if operator not in STRING_OPERATORS:
+                raise ValueError(f"{field} can be compared with {', '.join(STRING_OPERATORS)}")
+            values = [value.lower() for value in values]
+        elif field in numeric_fields:
+            if operator not in NUMERIC_OPERATORS:
+                raise ValueError(f"{field} can be compared with {', '.join(NUMERIC_OPERATORS)}")
+            if operator in ("<", "<=", ">", ">=") and len(values) != 1:
+                raise ValueError(f"{field}{operator} takes a single value")
+            try:
+                values = [float(value) for value in values]
+            except ValueError:
+                raise ValueError(f"{field} is compared with numbers")
+        else:
+            raise ValueError(
+                f"Cannot filter by '{field}', available fields: {', '.join(STRING_FIELDS + tuple(numeric_fields))}")
+        if not values:
+            raise ValueError(f"Filter clause '{part.strip()}' has no value")
+        clauses.append(Clause(field, operator, values))
+    return clauses
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+class FilterIndex:
+    def __init__(self, plans, region_fields):
+        """plans: plan name -> ServicePlan of one service type"""
+        self.numeric_fields = tuple(region_fields) + PLAN_NUMERIC_FIELDS
+        self.rows = []    # (plan name, region name), row ids are the positions
+        self.postings = {field: {} for field in STRING_FIELDS}    # field -> value -> set of row ids
+        columns = {field: [] for field in self.numeric_fields}
+        for plan_name, plan in plans.items():
+            for region, attributes in plan.regions.items():
+                row = len(self.rows)
+                self.rows.append((plan_name, region))
+                strings = {"cloud": region.split("-", 1)[0], "region": region, "plan": plan_name}
+                for field, value in strings.items():
+                    self.postings[field].setdefault(value.lower(), set()).add(row)
+                for field in self.numeric_fields:
+                    source = plan.data if field in PLAN_NUMERIC_FIELDS else attributes
+                    value = _number(source.get(field))
+                    if value is not None:
+                        columns[field].append((value, row))
+        self.columns = {field: sorted(column) for field, column in columns.items()}
+        self.all_rows = set(range(len(self.rows)))
+
+    def parse(self, expression):
+        return parse(expression, self.numeric_fields)
+
+    def _string_rows(self, clause):
+        postings = self.postings[clause.field]
+        if clause.operator == "~":
+            # Few distinct values per field, scanning them is cheap; their rows come from the index
+            keys = [key for key in postings if any(value in key for value in clause.values)]
+        else:
+            keys = [value for value in clause.values if value in postings]
+        rows = set().union(*[postings[key] for key in keys]) if keys else set()
+        return self.all_rows - rows if clause.operator == "!=" else rows
+
+    def _numeric_rows(self, clause):
+        column = self.columns[clause.field]
+        operator = clause.operator
+        if operator in ("=", "!="):
+            rows = set()
+            for value in clause.values:
+                start, end = bisect_left(column, (value, -1)), bisect_right(column, (value, math.inf))
+                rows.update(row for _, row in column[start:end])
+            return self.all_rows - rows if operator == "!=" else rows
+        value = clause.values[0]
+        if operator == "<":
+            selected = column[:bisect_left(column, (value, -1))]
+        elif operator == "<=":
+            selected = column[:bisect_right(column, (value, math.inf))]
+        elif operator == ">":
+            selected = column[bisect_right(column, (value, math.inf)):]
+        else:
+            selected = column[bisect_left(column, (value, -1)):]
+        return {row for _, row in selected}
+
+    def select(self, clauses):
+        """Row ids matching all clauses"""
+        if not clauses:
+            return self.all_rows
+        matches = [
+            self._string_rows(clause) if clause.field in STRING_FIELDS else self._numeric_rows(clause)
+            for clause in clauses
+        ]
+        matches.sort(key=len)
+        result = set(matches[0])
+        for rows in matches[1:]:
+            result &= rows
+            if not result:
+                break
+        return result
+
+    def regions(self, plan, clauses):
+        """Names of the plan's regions matching the clauses"""
+        return {self.rows[row][1] for row in self.select(clauses + [Clause("plan", "=", [plan.lower()])])}
+
+    def plans(self, clauses):
+        """Plan name -> count of matching regions, for plans with at least one"""
+        counts = {}
+        for row in self.select(clauses):
+            plan = self.rows[row][0]
+            counts[plan] = counts.get(plan, 0) + 1
+        return counts
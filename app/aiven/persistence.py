@@ -0,0 +1,143 @@
+"""
+Optional persistent cache backend (CACHE_BACKEND=sqlite): cached upstream responses are written to an SQLite
+database in WAL mode, so they survive restarts and are shared by all workers on the host.
+
+Private responses are encrypted with a key derived from the token they were fetched with (and CACHE_SECRET), and
+their urls are stored as keyed hashes. Without the token the rows can be neither read nor matched to a project.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import sqlite3
+import struct
+import threading
+import time
+from logging import getLogger
+
+from app import settings
+
+
+logger = getLogger("persistence")
+
+
+SHARED_NAMESPACE = "shared"
+
+
+class SQLiteStore:
+    PRUNE_EVERY = 1000    # saves
+
+    def __init__(self, path, private_max_age):
+        self.private_max_age = private_max_age
+        self.saves = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "namespace TEXT NOT NULL, url_key TEXT NOT NULL, created_at REAL NOT NULL, payload BLOB NOT NULL, "
+            "PRIMARY KEY (namespace, url_key))"
+        )
+        self.prune()
+
+    def load(self, namespace, url_key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT payload FROM responses WHERE namespace = ? AND url_key = ?", (namespace, url_key)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save(self, namespace, url_key, created_at, payload):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (namespace, url_key, created_at, payload) VALUES (?, ?, ?, ?)",
+                (namespace, url_key, created_at, payload),
+            )
+            self.saves += 1
+        if self.saves % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Private responses are kept only for a while, the shared catalog until it is replaced"""
+        with self.lock:
+            deleted = self.connection.execute(
+                "DELETE FROM responses WHERE namespace != ? AND created_at < ?",
+                (SHARED_NAMESPACE, time.time() - self.private_max_age),
+            ).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} persisted private responses")
+
+
+def pack(response):
+    meta = json.dumps({
+        "status_code": response.status_code,
+        "headers": response.headers,
+        "created_at": response.created_at,
+    }).encode("utf-8")
+    return struct.pack(">I", len(meta)) + meta + response.content
+
+
+def unpack(payload):
+    """Returns (status_code, headers, content, created_at)"""
+    (length,) = struct.unpack(">I", payload[:4])
+    meta = json.loads(payload[4:4 + length])
+    return meta["status_code"], meta["headers"], payload[4 + length:], meta["created_at"]
+
+
+class PlainCodec:
+    """Shared, public data: stored as is"""
+
+    namespace = SHARED_NAMESPACE
+
+    def url_key(self, url):
+        return url
+
+    def encode(self, payload):
+        return payload
+
+    def decode(self, payload):
+        return payload
+
+
+class TokenCodec:
+    """Private data: encrypted with a key only the holder of the token can derive"""
+
+    def __init__(self, namespace, token):
+        from cryptography.fernet import Fernet, InvalidToken
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+        self.namespace = namespace
+        self._invalid = InvalidToken
+        material = HKDF(
+            algorithm=hashes.SHA256(), length=64, salt=settings.CACHE_SECRET.encode("utf-8"),
+            info=b"pagingtest private cache",
+        ).derive(token.encode("utf-8"))
+        self._fernet = Fernet(base64.urlsafe_b64encode(material[:32]))
+        self._url_key = material[32:]
+
+    def url_key(self, url):
+        return hmac.new(self._url_key, url.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def encode(self, payload):
+        return self._fernet.encrypt(payload)
+
+    def decode(self, payload):
+        try:
+            return self._fernet.decrypt(payload)
+        except self._invalid:
+            return None    # Written with another CACHE_SECRET
+
+
+_store = None
+
+
+def get_store():
+    """The SQLite store when CACHE_BACKEND=sqlite, otherwise None"""
+    global _store
+    if settings.CACHE_BACKEND != "sqlite":
+        return None
+    if _store is None:
+        _store = SQLiteStore(settings.CACHE_PATH, settings.CACHE_PERSIST_PRIVATE_MAX_AGE)
+    return _store
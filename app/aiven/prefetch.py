@@ -0,0 +1,76 @@
+"""
+Prefetch of the service lists of a token's projects (PREFETCH_SERVICES=1). A /projects listing is usually followed
+by /services?project=X for every project, so right after it the lists are fetched in the background, at
+background priority and at most PREFETCH_CONCURRENCY at a time over all tokens. Prefetching stops when the token's
+session is evicted.
+
+Whether it pays off shows in aiven_prefetch_total: the ratio of used to fetched responses.
+"""
+import asyncio
+import weakref
+from logging import getLogger
+
+from app import metrics, settings
+from app.aiven import cache, headers, scheduler
+
+
+logger = getLogger("prefetch")
+
+
+_prefetched = weakref.WeakKeyDictionary()    # session -> urls prefetched and not yet used
+_running = {}    # token hash -> task, one prefetch per token at a time
+_semaphore = None
+stats = {"fetched": 0, "skipped": 0, "used": 0}
+
+
+def _count(result):
+    stats[result] += 1
+    metrics.observe_prefetch(result)
+
+
+def observe_use(session, url):
+    """Called for responses served from the cache: counts the first use of a prefetched one"""
+    urls = _prefetched.get(session)
+    if urls and url in urls:
+        urls.discard(url)
+        _count("used")
+
+
+def schedule(token, projects):
+    """Prefetches the service lists of the projects for the token, unless disabled or already running"""
+    if not settings.PREFETCH_SERVICES or not projects:
+        return
+    key = cache.token_hash(token)
+    if key in _running:
+        return
+    session = cache.get_private_session(token)
+    task = asyncio.ensure_future(_prefetch(session, token, list(projects)))
+    _running[key] = task
+    task.add_done_callback(lambda _: _running.pop(key, None))
+
+
+async def _prefetch(session, token, projects):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.PREFETCH_CONCURRENCY)
+    from app.aiven import services    # services imports this module
+
+    async def _fetch(project):
+        url = services.services_url(project)
+        async with _semaphore:
+            if session.evicted:
+                return
+            if session.has_fresh(url):
+                _count("skipped")
+                return
+            try:
+                response = await session.get(url, headers=headers.get_headers(token))
+            except Exception as e:
+                logger.info(f"Prefetching services of project {project} failed: {e}")
+                return
+            if response and not session.evicted:
+                _prefetched.setdefault(session, set()).add(url)
+                _count("fetched")
+
+    with scheduler.background():
+        await asyncio.gather(*[_fetch(project) for project in projects])
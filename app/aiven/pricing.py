@@ -0,0 +1,158 @@
+"""
+The plans of the catalog flattened into a columnar table: one row per (service type, plan, region), with the
+names stored as integer codes of interned categories and the numbers as NumPy arrays. Aggregates over plans and
+regions are then vectorized operations on the columns.
+"""
+import math
+
+import numpy as np
+
+
+NUMERIC_COLUMNS = ("price_usd", "disk_space_mb", "node_memory_mb")
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class Categories:
+    """Distinct names of a column, the code of a name is its position"""
+
+    def __init__(self):
+        self.names = []
+        self.codes = {}
+
+    def code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+class PricingTable:
+    def __init__(self, service_types):
+        """service_types: name -> ServiceTypeEntry"""
+        self.service_types = Categories()
+        self.plans = Categories()
+        self.regions = Categories()
+        codes = {"service_type": [], "plan": [], "region": []}
+        values = {column: [] for column in NUMERIC_COLUMNS}
+        for type_name, entry in service_types.items():
+            type_code = self.service_types.code(type_name)
+            for plan_name, plan in entry.plans.items():
+                plan_code = self.plans.code(plan_name)
+                for region, attributes in plan.regions.items():
+                    codes["service_type"].append(type_code)
+                    codes["plan"].append(plan_code)
+                    codes["region"].append(self.regions.code(region))
+                    for column in NUMERIC_COLUMNS:
+                        values[column].append(_number(attributes.get(column)))
+        self.columns = {name: np.array(column, dtype=np.int32) for name, column in codes.items()}
+        self.columns.update({name: np.array(column, dtype=np.float64) for name, column in values.items()})
+
+    def __len__(self):
+        return len(self.columns["plan"])
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def _rows(self, service_type, plan=None, region=None, min_memory_mb=None):
+        """Positions of the priced rows of the service type, optionally of one plan or region"""
+        mask = (self.columns["service_type"] == self.service_types.codes.get(service_type, -1))
+        mask &= ~np.isnan(self.columns["price_usd"])
+        if plan is not None:
+            mask &= self.columns["plan"] == self.plans.codes.get(plan, -1)
+        if region is not None:
+            mask &= self.columns["region"] == self.regions.codes.get(region, -1)
+        if min_memory_mb is not None:
+            mask &= self.columns["node_memory_mb"] >= min_memory_mb
+        return np.flatnonzero(mask)
+
+    def cheapest_by_region(self, service_type, min_memory_mb=None):
+        """Region name -> the cheapest plan there, as {plan, price_usd, node_memory_mb}, ordered by region"""
+        rows = self._rows(service_type, min_memory_mb=min_memory_mb)
+        regions, prices = self.columns["region"][rows], self.columns["price_usd"][rows]
+        # Ordered by region, then by price; the first row of each region is its cheapest plan
+        ordered = rows[np.lexsort((prices, regions))]
+        region_codes, first = np.unique(self.columns["region"][ordered], return_index=True)
+        cheapest = ordered[first]
+        result = {
+            self.regions.names[region]: {
+                "plan": self.plans.names[plan],
+                "price_usd": price,
+                # Missing in the catalog: NaN in the column, null in JSON
+                "node_memory_mb": None if math.isnan(memory) else memory,
+            }
+            for region, plan, price, memory in zip(
+                region_codes.tolist(), self.columns["plan"][cheapest].tolist(),
+                self.columns["price_usd"][cheapest].tolist(), self.columns["node_memory_mb"][cheapest].tolist(),
+            )
+        }
+        return dict(sorted(result.items()))
+
+    def _stats_by_plan(self, rows, values):
+        """Plan code -> (min, max, median, mean, region of min, region of max, region count) of the values"""
+        valid = ~np.isnan(values)
+        rows, values = rows[valid], values[valid]
+        if len(rows) == 0:
+            return {}
+        plans = self.columns["plan"][rows]
+        order = np.lexsort((values, plans))
+        plans, values, rows = plans[order], values[order], rows[order]
+        starts = np.flatnonzero(np.r_[True, plans[1:] != plans[:-1]])
+        ends = np.r_[starts[1:], len(plans)]
+        counts = ends - starts
+        medians = (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+        means = np.add.reduceat(values, starts) / counts
+        region = self.columns["region"]
+        return {
+            plan: (low, high, median, mean, self.regions.names[low_region], self.regions.names[high_region], count)
+            for plan, low, high, median, mean, low_region, high_region, count in zip(
+                plans[starts].tolist(), values[starts].tolist(), values[ends - 1].tolist(), medians.tolist(),
+                means.tolist(), region[rows[starts]].tolist(), region[rows[ends - 1]].tolist(), counts.tolist(),
+            )
+        }
+
+    def price_stats(self, service_type, plan=None):
+        """Plan name -> min, max, median and mean price over its regions, with the cheapest and dearest region"""
+        rows = self._rows(service_type, plan=plan)
+        return {
+            self.plans.names[code]: {
+                "regions": count,
+                "min_price_usd": low,
+                "max_price_usd": high,
+                "median_price_usd": median,
+                "mean_price_usd": mean,
+                "cheapest_region": low_region,
+                "most_expensive_region": high_region,
+            }
+            for code, (low, high, median, mean, low_region, high_region, count)
+            in self._stats_by_plan(rows, self.columns["price_usd"][rows]).items()
+        }
+
+    def price_per_gb(self, service_type, region=None):
+        """
+        Plan name -> price per GB of node memory over its regions (or in the region): min, max and median, ordered
+        from the cheapest median
+        """
+        rows = self._rows(service_type, region=region)
+        memory_gb = self.columns["node_memory_mb"][rows] / 1024
+        with np.errstate(divide="ignore", invalid="ignore"):
+            per_gb = np.where(memory_gb > 0, self.columns["price_usd"][rows] / memory_gb, np.nan)
+        stats = self._stats_by_plan(rows, per_gb)
+        return {
+            self.plans.names[code]: {
+                "regions": count,
+                "min_price_usd_per_gb": low,
+                "max_price_usd_per_gb": high,
+                "median_price_usd_per_gb": median,
+                "cheapest_region": low_region,
+            }
+            for code, (low, high, median, mean, low_region, high_region, count)
+            in sorted(stats.items(), key=lambda item: item[1][2])
+        }
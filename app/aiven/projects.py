@@ -1,10 +1,13 @@
 from app.aiven import cache, headers
-from app.settings import BASEURL
+from app.settings import AIVEN_API_URL, BASEURL
 
 
-def get_projects(token):
+PROJECTS_URL = f"{AIVEN_API_URL}/v1/project"
+
+
+async def get_projects(token):
     session = cache.get_private_session(token)
-    response = session.get('https://api.aiven.io/v1/project', headers=headers.get_headers(token))
+    response = await session.get(PROJECTS_URL, headers=headers.get_headers(token))
     if response:
         return_value = { 'from_cache': response.from_cache, 'projects': []}
 
@@ -0,0 +1,85 @@
+"""
+Background refresh of the public catalog in the shared session. Requests are always answered from the last good
+copy; a new copy replaces it only after it has been fetched and indexed.
+"""
+import asyncio
+import time
+from logging import getLogger
+
+from app import settings
+from app.aiven import cache, scheduler, services
+
+
+logger = getLogger("refresher")
+
+
+CATALOG_URLS = [services.SERVICE_TYPES_URL, services.SERVICE_VERSIONS_URL]
+
+_refreshing = {}    # url -> task, at most one refresh per url at a time
+_task = None
+stats = {
+    "last_refresh_at": None,
+    "last_refresh_latency": None,
+    "refresh_count": 0,
+    "refresh_errors": 0,
+}
+
+
+async def refresh(url):
+    start = time.monotonic()
+    try:
+        with scheduler.background():
+            response = await cache.get_shared_session().fetch(url)
+        if not response:
+            raise Exception(f"{response.status_code} from upstream")
+        # Index the new payload right away, so no request pays for it
+        if url == services.SERVICE_TYPES_URL:
+            await services.get_service_catalog(wait=True)
+        elif url == services.SERVICE_VERSIONS_URL:
+            await services.get_version_index()
+        stats["refresh_count"] += 1
+    except Exception as e:
+        stats["refresh_errors"] += 1
+        logger.warning(f"Refreshing {url} failed, serving the previous copy: {e}")
+    finally:
+        stats["last_refresh_at"] = time.time()
+        stats["last_refresh_latency"] = time.monotonic() - start
+
+
+def schedule_refresh(url):
+    if url in _refreshing:
+        return
+    task = asyncio.ensure_future(refresh(url))
+    _refreshing[url] = task
+    task.add_done_callback(lambda _: _refreshing.pop(url, None))
+
+
+async def _run(interval):
+    while True:
+        await asyncio.sleep(interval)
+        for url in CATALOG_URLS:
+            schedule_refresh(url)
+
+
+def start():
+    global _task
+    cache.get_shared_session().on_stale = schedule_refresh
+    if settings.CATALOG_REFRESH_INTERVAL > 0 and _task is None:
+        _task = asyncio.ensure_future(_run(settings.CATALOG_REFRESH_INTERVAL))
+
+
+async def stop():
+    global _task
+    cache.get_shared_session().on_stale = None
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    for task in list(_refreshing.values()):
+        task.cancel()
+
+
+def get_catalog_age():
+    response = cache.get_shared_session().responses.get(services.SERVICE_TYPES_URL)
+    if response is None:
+        return None
+    return time.time() - response.created_at
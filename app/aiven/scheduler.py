@@ -0,0 +1,177 @@
+"""
+Rate limiting of upstream calls. Every call takes a token from the global bucket and from the bucket of its API
+token; calls that have to wait are queued and let through in priority order, interactive before background.
+Retry-After of a 429 response stops the calls of that token (or all calls, for the public catalog) until then.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app import metrics, settings
+
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority = ContextVar("upstream_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background():
+    """Upstream calls made inside the block, including tasks started from it, wait behind interactive ones"""
+    reset_token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(reset_token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate    # tokens per second, 0 for no limit
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        """Seconds until a token can be taken, 0 when one can be taken now"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.rate <= 0:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+    def block(self, seconds, now):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class Waiter:
+    def __init__(self, priority, seq, key, future):
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.future = future
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Scheduler:
+    MAX_TOKEN_BUCKETS = 10000    # least recently used buckets of other tokens are dropped, they are full anyway
+
+    def __init__(self, rate, burst, token_rate, token_burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.token_rate = token_rate
+        self.token_burst = token_burst
+        self.token_buckets = OrderedDict()    # key -> TokenBucket
+        self.waiting = []    # heap of Waiter
+        self._seq = itertools.count()
+        self._timer = None
+
+    def _token_bucket(self, key):
+        bucket = self.token_buckets.get(key)
+        if bucket is None:
+            bucket = self.token_buckets[key] = TokenBucket(self.token_rate, self.token_burst)
+            if len(self.token_buckets) > self.MAX_TOKEN_BUCKETS:
+                self.token_buckets.popitem(last=False)
+        else:
+            self.token_buckets.move_to_end(key)
+        return bucket
+
+    def _delay(self, key, now):
+        delay = self.bucket.delay(now)
+        if key is not None:
+            delay = max(delay, self._token_bucket(key).delay(now))
+        return delay
+
+    def _take(self, key):
+        self.bucket.take()
+        if key is not None:
+            self._token_bucket(key).take()
+
+    def queue_depth(self, priority):
+        return sum(1 for waiter in self.waiting if waiter.priority == priority and not waiter.future.done())
+
+    async def acquire(self, key, priority):
+        """Waits until a call for the key (None for calls without a token) may go upstream"""
+        start = time.monotonic()
+        if not self.waiting and self._delay(key, start) == 0:
+            self._take(key)
+            metrics.observe_queue_wait(PRIORITY_NAMES[priority], 0)
+            return
+        waiter = Waiter(priority, next(self._seq), key, asyncio.get_running_loop().create_future())
+        heapq.heappush(self.waiting, waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        finally:
+            metrics.observe_queue_wait(PRIORITY_NAMES[priority], time.monotonic() - start)
+
+    def _dispatch(self):
+        """Lets waiters through in priority order, as far as the buckets allow, and sets a timer for the rest"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        next_wake = None
+        held = []    # Waiters of tokens without tokens left, they do not hold up the others
+        while self.waiting:
+            waiter = self.waiting[0]
+            if waiter.future.done():    # Cancelled
+                heapq.heappop(self.waiting)
+                continue
+            global_delay = self.bucket.delay(now)
+            if global_delay > 0:
+                next_wake = global_delay if next_wake is None else min(next_wake, global_delay)
+                break
+            heapq.heappop(self.waiting)
+            delay = self._delay(waiter.key, now)
+            if delay > 0:
+                held.append(waiter)
+                next_wake = delay if next_wake is None else min(next_wake, delay)
+                continue
+            self._take(waiter.key)
+            waiter.future.set_result(None)
+        for waiter in held:
+            heapq.heappush(self.waiting, waiter)
+        if next_wake is not None:
+            self._timer = asyncio.get_running_loop().call_later(next_wake, self._dispatch)
+
+    def retry_after(self, key, seconds):
+        """Upstream asked to wait: no calls for the key (all calls when None) for the given seconds"""
+        bucket = self.bucket if key is None else self._token_bucket(key)
+        bucket.block(seconds, time.monotonic())
+
+
+def token_key(headers):
+    """Rate limit key of the call, the hash of its API token. None for calls without one"""
+    token = (headers or {}).get("authorization")
+    if not token:
+        return None
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+scheduler = Scheduler(
+    settings.UPSTREAM_RATE, settings.UPSTREAM_BURST, settings.UPSTREAM_TOKEN_RATE, settings.UPSTREAM_TOKEN_BURST,
+)
+for _priority_value, _name in PRIORITY_NAMES.items():
+    metrics.track_queue_depth(_name, lambda priority=_priority_value: scheduler.queue_depth(priority))
@@ -0,0 +1,189 @@
+"""
+Search over the services of all projects of a token (/services?q=). The index is built on first use from the
+service lists of the projects, then refreshed in the background every SEARCH_INDEX_REFRESH_INTERVAL seconds:
+only projects whose service list changed are applied, as a diff. Refreshing stops when the token's session is
+evicted or the index has not been searched for PRIVATE_CACHE_IDLE_TIMEOUT seconds.
+
+Names are kept sorted for prefix search, and indexed by trigram for substring search.
+"""
+import asyncio
+import time
+import weakref
+from bisect import bisect_left, insort
+from logging import getLogger
+
+from app import settings
+from app.aiven import cache, headers, projects as aiven_projects, scheduler
+
+
+logger = getLogger("search")
+
+FILTER_FIELDS = ("project", "service_type", "state")
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class ServiceIndex:
+    def __init__(self):
+        self.records = {}    # (project, service name) -> record
+        self.names = []    # sorted (lowercase name, project, name)
+        self.postings = {field: {} for field in FILTER_FIELDS}    # field -> value -> set of keys
+        self.trigrams = {}    # trigram of a lowercase name -> set of keys
+        self.project_versions = {}    # project -> version of the service list applied
+        self.errors = {}    # project -> error of its last refresh
+        self.built_at = None
+        self.updated_at = None
+        self.last_used = time.time()
+        self.lock = asyncio.Lock()
+        self.task = None
+
+    @property
+    def age(self):
+        """Seconds since the index was last brought up to date with upstream"""
+        return None if self.updated_at is None else time.time() - self.updated_at
+
+    def _add(self, key, record):
+        self.records[key] = record
+        name = record["name"].lower()
+        insort(self.names, (name, key[0], key[1]))
+        for field in FILTER_FIELDS:
+            self.postings[field].setdefault(record[field], set()).add(key)
+        for trigram in _trigrams(name):
+            self.trigrams.setdefault(trigram, set()).add(key)
+
+    def _remove(self, key):
+        record = self.records.pop(key)
+        name = record["name"].lower()
+        del self.names[bisect_left(self.names, (name, key[0], key[1]))]
+        for field in FILTER_FIELDS:
+            keys = self.postings[field][record[field]]
+            keys.discard(key)
+            if not keys:
+                del self.postings[field][record[field]]
+        for trigram in _trigrams(name):
+            keys = self.trigrams[trigram]
+            keys.discard(key)
+            if not keys:
+                del self.trigrams[trigram]
+
+    def apply(self, project, services, version):
+        """Brings the services of the project to the given list, touching only what changed"""
+        current = {}
+        for service in services:
+            record = {
+                "name": service.get("service_name"),
+                "project": project,
+                "service_type": service.get("service_type"),
+                "state": service.get("state"),
+                "plan": service.get("plan"),
+                "cloud_name": service.get("cloud_name"),
+            }
+            current[(project, record["name"])] = record
+        for key in list(self.postings["project"].get(project, ())):
+            if current.get(key) != self.records[key]:
+                self._remove(key)
+        for key, record in current.items():
+            if key not in self.records:
+                self._add(key, record)
+        self.project_versions[project] = version
+        self.errors.pop(project, None)
+
+    def remove_project(self, project):
+        for key in list(self.postings["project"].get(project, ())):
+            self._remove(key)
+        self.project_versions.pop(project, None)
+        self.errors.pop(project, None)
+
+    def search(self, q=None, prefix=False, **filters):
+        """
+        Records whose name contains q (or starts with it), matching the filters (project, service_type, state),
+        ordered by name
+        """
+        keys = None
+        if q:
+            needle = q.lower()
+            if prefix:
+                start = bisect_left(self.names, (needle,))
+                keys = set()
+                for name, project, service in self.names[start:]:
+                    if not name.startswith(needle):
+                        break
+                    keys.add((project, service))
+            elif len(needle) >= 3:
+                candidates = sorted((self.trigrams.get(trigram, set()) for trigram in _trigrams(needle)), key=len)
+                keys = set(candidates[0]).intersection(*candidates[1:])
+                keys = {key for key in keys if needle in key[1].lower()}
+            else:
+                keys = {(project, service) for name, project, service in self.names if needle in name}
+        for field, value in filters.items():
+            if value is None:
+                continue
+            matches = self.postings[field].get(value, set())
+            keys = set(matches) if keys is None else keys & matches
+        if keys is None:
+            return [self.records[(project, service)] for _, project, service in self.names]
+        return sorted((self.records[key] for key in keys), key=lambda record: (record["name"].lower(), record["project"]))
+
+
+_indexes = weakref.WeakKeyDictionary()    # session -> ServiceIndex, dropped with the session
+
+
+async def _refresh(session, token, index):
+    from app.aiven import services    # services imports the modules this one does
+
+    response = await session.get(aiven_projects.PROJECTS_URL, headers=headers.get_headers(token))
+    if not response:
+        raise Exception(response.json())
+    projects = [project.get("project_name") for project in response.json().get("projects", [])]
+    for project in list(index.project_versions):
+        if project not in projects:
+            index.remove_project(project)
+
+    semaphore = asyncio.Semaphore(settings.SERVICES_FANOUT_CONCURRENCY)
+
+    async def _fetch(project):
+        async with semaphore:
+            try:
+                response = await session.get(services.services_url(project), headers=headers.get_headers(token))
+                if not response:
+                    raise Exception(response.json())
+            except Exception as e:
+                index.errors[project] = {"project": project, "error": str(e)}
+                return
+            if index.project_versions.get(project) != response.version:
+                index.apply(project, response.json().get("services", []), response.version)
+
+    await asyncio.gather(*[_fetch(project) for project in projects])
+    index.updated_at = time.time()
+
+
+async def _keep_fresh(session, token, index):
+    while True:
+        await asyncio.sleep(settings.SEARCH_INDEX_REFRESH_INTERVAL)
+        if session.evicted or time.time() - index.last_used > settings.PRIVATE_CACHE_IDLE_TIMEOUT:
+            index.task = None
+            return
+        try:
+            with scheduler.background():
+                await _refresh(session, token, index)
+        except Exception as e:
+            logger.warning(f"Refreshing the service index failed, keeping the previous one: {e}")
+
+
+async def get_index(token):
+    """The token's ServiceIndex, built on first use. Starts the background refresh when it is not running."""
+    session = cache.get_private_session(token)
+    index = _indexes.get(session)
+    if index is None:
+        index = _indexes[session] = ServiceIndex()
+    index.last_used = time.time()
+    if index.built_at is None:
+        async with index.lock:
+            if index.built_at is None:    # Unless built while waiting for the lock
+                await _refresh(session, token, index)
+                index.built_at = index.updated_at
+    if index.task is None and settings.SEARCH_INDEX_REFRESH_INTERVAL > 0:
+        index.task = asyncio.ensure_future(_keep_fresh(session, token, index))
+    return index
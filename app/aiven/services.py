@@ -1,73 +1,256 @@
+import asyncio
+import weakref
+from collections import OrderedDict
+from logging import getLogger
+
 from app.aiven import cache
+from app.aiven import catalog
 from app.aiven import headers
+from app.aiven import prefetch
 from app.aiven import projects as aiven_projects
-from app.settings import BASEURL
+from app.aiven import snapshots
+from app.settings import AIVEN_API_URL, BASEURL, SERVICES_FANOUT_CONCURRENCY, SERVICE_SNAPSHOT_MAX
+
+
+logger = getLogger("services")
+
+SERVICE_TYPES_URL = f"{AIVEN_API_URL}/v1/service_types"
+SERVICE_VERSIONS_URL = f"{AIVEN_API_URL}/v1/service_versions"
+
+
+_catalog = None
+_building = None    # (payload version, task) of the catalog being built
+_versions = None
+# session -> {(project, service name) -> ServiceSnapshot or TopicIndex}, least recently used first. Dropped with
+# the session when it is evicted from the private cache.
+_snapshots = weakref.WeakKeyDictionary()
+_topic_indexes = weakref.WeakKeyDictionary()
+
+
+def _remember(entries, session, key, value):
+    """Keep value for the session, at most SERVICE_SNAPSHOT_MAX per session"""
+    remembered = entries.get(session)
+    if remembered is None:
+        remembered = entries[session] = OrderedDict()
+    remembered[key] = value
+    remembered.move_to_end(key)
+    while len(remembered) > SERVICE_SNAPSHOT_MAX:
+        remembered.popitem(last=False)
+
+
+async def get_service_catalog(wait=False):
+    """
+    Service types as a ServiceCatalog. The payload is decoded and indexed only when upstream returns a new version,
+    in a thread so other requests are served meanwhile. Until the new catalog is ready the previous one is
+    returned, unless wait is set or there is none yet.
+    """
+    response = await cache.get_shared_session().get(SERVICE_TYPES_URL)
+    if not response:
+        raise Exception(response.json())
+    if _catalog is None or _catalog.version != response.version:
+        build = _build_catalog(response)
+        if _catalog is None or wait:
+            # Shielded: the build is shared, a request going away must not cancel it
+            await asyncio.shield(build)
+    return _catalog, response.from_cache
+
 
+def _build_catalog(response):
+    """Task building the catalog of the response, at most one per payload version"""
+    global _building
+    if _building is not None and _building[0] == response.version:
+        return _building[1]
+    task = asyncio.ensure_future(_build(response))
+    # Requests served from the previous catalog do not await the task, its error is logged in _build
+    task.add_done_callback(lambda done: done.cancelled() or done.exception())
+    _building = (response.version, task)
+    return task
 
-def get_service_types():
-    response = cache.get_shared_session().get("https://api.aiven.io/v1/service_types")
-    return response.json(), response.from_cache
 
+async def _build(response):
+    global _catalog, _building
+    try:
+        built = await asyncio.to_thread(lambda: catalog.ServiceCatalog(response.json(), response.version))
+    except Exception as e:
+        logger.warning(f"Building the service catalog failed: {e}")
+        raise
+    finally:
+        latest = _building is None or _building[0] == response.version
+        if _building is not None and _building[0] == response.version:
+            _building = None
+    # The catalog is swapped on the loop, and only if no newer version was fetched meanwhile
+    if latest:
+        _catalog = built
 
-def get_service_versions(service_name=None):
-    response = cache.get_shared_session().get("https://api.aiven.io/v1/service_versions")
-    versions = response.json().get("service_versions")
+
+def get_loaded_catalog():
+    """The ServiceCatalog built last, None before the first request needing it"""
+    return _catalog
+
+
+async def get_version_index():
+    """
+    Service versions as a VersionIndex, rebuilt only when upstream returns a new version of the payload.
+    """
+    global _versions
+    response = await cache.get_shared_session().get(SERVICE_VERSIONS_URL)
+    if not response:
+        raise Exception(response.json())
+    if _versions is None or _versions.version != response.version:
+        _versions = catalog.VersionIndex(response.json(), response.version)
+    return _versions, response.from_cache
+
+
+async def get_service_versions(service_name=None, available_at=None, eol_before=None):
+    index, _ = await get_version_index()
     if service_name:
-        versions = {
-            version.get("major_version") :
-            {
-                "state": version.get("state"),
-                "lifecycle": {
-                    "upstream_end_of_life_time": version.get("upstream_end_of_life_time"),
-                    "aiven_end_of_life_time": version.get("aiven_end_of_life_time"),
-                    "aiven_availability_end_time": version.get("availability_end_time"),
-                    "aiven_availability_start_time": version.get("availability_start_time"),
-                    "aiven_end_of_life_help_article_url": version.get("end_of_life_help_article_url"),
-                    "aiven_termination_time": version.get("termination_time"),
-                }
-            }
-            for version in versions if version.get("service_type") == service_name
-        }
-    return versions
+        return index.find(service_name, available_at=available_at, eol_before=eol_before)
+    return index.versions
+
 
+def services_url(project):
+    return f"{AIVEN_API_URL}/v1/project/{project}/service"
 
-def get_services_for_project(token, project):
+
+async def get_services_for_project(token, project):
     session = cache.get_private_session(token)
-    response = session.get(f"https://api.aiven.io/v1/project/{project}/service", headers=headers.get_headers(token))
+    url = services_url(project)
+    response = await session.get(url, headers=headers.get_headers(token))
+    if response.from_cache:
+        prefetch.observe_use(session, url)
+    if not response:
+        raise Exception(response.json())
     services = [s.get('service_name') for s in response.json().get('services')]
     return services, response.from_cache
 
 
-def get_services(token, projects=[]):
+def service_list_item(project, service):
+    return {
+        "account": {
+            "name": "NOT IMPLEMENTED",
+            "url": "NOT IMPLEMENTED"
+        },
+        "project": {
+            "name": project,
+            "url": f"{BASEURL}/projects/{project}/"
+            },
+        "service": {
+            "name": service,
+            "url": f"{BASEURL}/projects/{project}/services/{service}/"
+            }
+    }
+
+
+async def get_project_names(token):
+    json_data, from_cache = await aiven_projects.get_projects(token)
+    return [p.get('project_name') for p in json_data.get('projects')]
+
+
+async def iter_services(token, projects):
+    """
+    Yields (project, service list items, error) for each project as soon as it has been fetched, in completion
+    order. At most SERVICES_FANOUT_CONCURRENCY projects are fetched at a time.
+    """
+    semaphore = asyncio.Semaphore(SERVICES_FANOUT_CONCURRENCY)
+
+    async def _fetch(project):
+        async with semaphore:
+            try:
+                services, _ = await get_services_for_project(token, project)
+                return project, [service_list_item(project, service) for service in services], None
+            except Exception as e:
+                logger.warning(f"Fetching services of project {project} failed: {e}")
+                return project, [], {"project": project, "error": str(e)}
+
+    tasks = [asyncio.ensure_future(_fetch(project)) for project in projects]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The client may go away in the middle of the stream
+        for task in tasks:
+            task.cancel()
+
+
+async def get_services(token, projects=[]):
     """
     Get services from projects. If no project is defined, returns _all_ services from all projects the user has access to.
+
+    Projects are fetched concurrently, at most SERVICES_FANOUT_CONCURRENCY at a time. Services keep the project order.
+    Returns (services, errors) where errors lists the projects that could not be fetched.
     """
     return_value = []
+    errors = []
 
     if projects:
         pass
     else:
-        json_data, from_cache = aiven_projects.get_projects(token)
-        projects = [p.get('project_name') for p in json_data.get('projects')]
+        projects = await get_project_names(token)
 
+    results = {}
+    async for project, service_list, error in iter_services(token, projects):
+        results[project] = (service_list, error)
     for project in projects:
-        print(f"Project: {project}")
-        services, _ = get_services_for_project(token, project)
-        for service in services:
-            return_value.append(
-                {
-                    "account": {
-                        "name": "NOT IMPLEMENTED",
-                        "url": "NOT IMPLEMENTED"
-                    },
-                    "project": { 
-                        "name": project, 
-                        "url": f"{BASEURL}/projects/{project}/"
-                        },
-                    "service": { 
-                        "name": service, 
-                        "url": f"{BASEURL}/projects/{project}/services/{service}/"
-                        }
-                }
-            )
-    return return_value
\ No newline at end of file
+        service_list, error = results[project]
+        if error:
+            errors.append(error)
+        return_value.extend(service_list)
+    return return_value, errors
+
+
+async def find_project(token, service_name):
+    """
+    Project of the service among the projects of the token, None if there is no such service.
+    """
+    projects = await get_project_names(token)
+    results = iter_services(token, projects)
+    try:
+        async for project, service_list, _ in results:
+            if any(item["service"]["name"] == service_name for item in service_list):
+                return project
+    finally:
+        await results.aclose()
+    return None
+
+
+async def get_service_snapshot(token, service_name, project=None):
+    """
+    The service as a ServiceSnapshot, parsed only when upstream returns a new version of it. Without a project
+    it is looked up from the service lists of the token's projects. Raises LookupError for unknown services.
+    """
+    if project is None:
+        project = await find_project(token, service_name)
+        if project is None:
+            raise LookupError(f"Service {service_name} not found")
+    session = cache.get_private_session(token)
+    response = await session.get(
+        f"{AIVEN_API_URL}/v1/project/{project}/service/{service_name}", headers=headers.get_headers(token))
+    if response.status_code == 404:
+        raise LookupError(f"Service {service_name} not found in project {project}")
+    if not response:
+        raise Exception(response.json())
+
+    key = (project, service_name)
+    snapshot = _snapshots.get(session, {}).get(key)
+    if snapshot is None or snapshot.version != response.version:
+        snapshot = snapshots.ServiceSnapshot(project, response.json().get("service", {}), response.version)
+    _remember(_snapshots, session, key, snapshot)
+    return snapshot, response.from_cache
+
+
+async def get_topic_index(token, service_name, project=None):
+    """
+    TopicIndex of the Kafka service, updated from the latest snapshot of the service. Returns (snapshot, index).
+    Raises LookupError for unknown services and services of other types.
+    """
+    snapshot, _ = await get_service_snapshot(token, service_name, project=project)
+    if snapshot.service_type != "kafka":
+        raise LookupError(f"{service_name} is not a Kafka service")
+    session = cache.get_private_session(token)
+    key = (snapshot.project, service_name)
+    index = _topic_indexes.get(session, {}).get(key)
+    if index is None:
+        index = snapshots.TopicIndex()
+    _remember(_topic_indexes, session, key, index)
+    index.update(snapshot)
+    return snapshot, index
@@ -0,0 +1,123 @@
+"""
+Parsed /v1/project/{project}/service/{service_name} payloads. The upstream service object holds the backups,
+databases, users, integrations and Kafka topics of the service at once; a snapshot is built once per payload
+version and every sub-resource is projected from it on first use.
+
+Kafka services can have tens of thousands of topics. Their TopicIndex is kept across snapshots and updated with
+the difference between successive topic lists.
+"""
+from app import paging
+
+
+TOPIC_FIELDS = ("partitions", "replication", "retention_hours", "min_insync_replicas", "state")
+
+
+class ServiceSnapshot:
+    def __init__(self, project, data, version):
+        self.project = project
+        self.version = version
+        self.data = data
+        self.name = data.get("service_name")
+        self.service_type = data.get("service_type")
+        self._projections = {}
+
+    def _projection(self, name, build):
+        if name not in self._projections:
+            self._projections[name] = build()
+        return self._projections[name]
+
+    @property
+    def backups(self):
+        """Newest first"""
+        return self._projection("backups", lambda: sorted(
+            (
+                {
+                    "backup_name": backup.get("backup_name"),
+                    "backup_time": backup.get("backup_time"),
+                    "data_size": backup.get("data_size"),
+                }
+                for backup in self.data.get("backups") or []
+            ),
+            key=lambda backup: backup["backup_time"] or "", reverse=True,
+        ))
+
+    @property
+    def databases(self):
+        return self._projection("databases", lambda: [
+            {"database_name": name} for name in sorted(self.data.get("databases") or [])
+        ])
+
+    @property
+    def users(self):
+        """Without passwords, those are in the connection info of the service"""
+        return self._projection("users", lambda: sorted(
+            (
+                {
+                    "username": user.get("username"),
+                    "type": user.get("type"),
+                    "authentication": user.get("authentication"),
+                }
+                for user in self.data.get("users") or []
+            ),
+            key=lambda user: user["username"] or "",
+        ))
+
+    @property
+    def integrations(self):
+        return self._projection("integrations", lambda: [
+            {
+                "integration_type": integration.get("integration_type"),
+                "source_service": integration.get("source_service"),
+                "dest_service": integration.get("dest_service"),
+                "active": integration.get("active"),
+            }
+            for integration in self.data.get("service_integrations") or []
+        ])
+
+    @property
+    def topics(self):
+        return self._projection("topics", lambda: sorted(
+            self.data.get("topics") or [], key=lambda topic: topic.get("topic_name") or "",
+        ))
+
+    @property
+    def primary_user(self):
+        """The admin user the service was created with, its credentials are in the service URI"""
+        params = self.data.get("service_uri_params") or {}
+        users = self.data.get("users") or []
+        for user in users:
+            if user.get("username") == params.get("user") or user.get("type") == "primary":
+                return user
+        return users[0] if users else {}
+
+
+class TopicIndex:
+    def __init__(self):
+        self.version = None    # of the snapshot the topics were last taken from
+        self.index = paging.SortedKeys({}, TOPIC_FIELDS)
+        self.stats = {"added": 0, "removed": 0, "changed": 0}
+
+    @property
+    def topics(self):
+        return self.index.records
+
+    def update(self, snapshot):
+        """Brings the index to the topics of the snapshot, applying only what changed since the last one"""
+        if snapshot.version == self.version:
+            return
+        current = {}
+        for topic in snapshot.topics:
+            record = {"name": topic.get("topic_name")}
+            record.update((field, topic.get(field)) for field in TOPIC_FIELDS)
+            current[record["name"]] = record
+        previous = self.index.records
+        removed = [name for name in previous if name not in current]
+        changed = {name: record for name, record in current.items() if previous.get(name) != record}
+        self.stats = {
+            "added": sum(1 for name in changed if name not in previous),
+            "removed": len(removed),
+            "changed": sum(1 for name in changed if name in previous),
+        }
+        if changed or removed:
+            self.index.update(changed, removed)
+        self.version = snapshot.version
@@ -0,0 +1,90 @@
+"""
+POST /batch: GET requests to the other routes, run concurrently in this process. Every sub-request goes through the
+whole application (routing, validation, caches) without HTTP, and shares the catalog and the token's session with
+the others. The JSON bodies of the sub-requests are spliced into the batch response as they are.
+"""
+import asyncio
+from urllib.parse import urlencode, urlsplit
+
+from app import serialization
+
+
+# Headers of the batch request not passed to the sub-requests: the sub-responses are neither compressed nor 304
+EXCLUDED_HEADERS = {b"content-length", b"content-type", b"accept-encoding", b"if-none-match", b"accept"}
+
+
+class SubResponse:
+    def __init__(self, path, status, body=b"", content_type=None):
+        self.path = path
+        self.status = status
+        self.body = body
+        self.content_type = content_type or ""
+
+    def render(self):
+        """JSON bytes of {path, status, body}, a JSON body is included without decoding it"""
+        head = serialization.dumps({"path": self.path, "status": self.status})
+        if self.content_type.startswith("application/json") and self.body:
+            body = self.body
+        else:
+            body = serialization.dumps(self.body.decode("utf-8", errors="replace") if self.body else None)
+        return head[:-1] + b',"body":' + body + b"}"
+
+
+def _error(path, status, detail):
+    return SubResponse(path, status, serialization.dumps({"detail": detail}), "application/json")
+
+
+async def call(app, scope, target, params=None):
+    """Response of the app to GET target (path and query) with the headers of the batch request in scope"""
+    url = urlsplit(target)
+    if not url.path.startswith("/") or url.scheme or url.netloc:
+        return _error(target, 400, "Only paths of this API can be requested")
+    if url.path.rstrip("/") == "/batch":
+        return _error(target, 400, "Batches can not be nested")
+    query = url.query
+    if params:
+        query = "&".join(part for part in (query, urlencode(params, doseq=True)) if part)
+
+    headers = [(key, value) for key, value in scope["headers"] if key not in EXCLUDED_HEADERS]
+    headers.append((b"accept", b"application/json"))
+    sub_scope = {
+        **scope,
+        "method": "GET",
+        "path": url.path,
+        "raw_path": url.path.encode("utf-8"),
+        "query_string": query.encode("utf-8"),
+        "headers": headers,
+    }
+    sub_scope.pop("router", None)
+    sub_scope.pop("endpoint", None)
+    sub_scope.pop("path_params", None)
+
+    start = {}
+    chunks = []
+    disconnected = asyncio.Event()
+
+    async def receive():
+        if disconnected.is_set():
+            await asyncio.Event().wait()    # Never: the sub-request stays connected until the response is sent
+        disconnected.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await app(sub_scope, receive, send)
+    except Exception as e:
+        if not start:
+            return _error(target, 500, str(e))
+    content_type = dict(start.get("headers", [])).get(b"content-type", b"").decode("latin-1")
+    return SubResponse(target, start.get("status", 500), b"".join(chunks), content_type)
+
+
+async def run(app, scope, requests):
+    """(target, params) pairs run concurrently, the rendered batch response in the same order"""
+    results = await asyncio.gather(*[call(app, scope, target, params) for target, params in requests])
+    return b'{"responses":[' + b",".join(result.render() for result in results) + b"]}"
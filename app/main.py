@@ -1,18 +1,26 @@
 from os import environ as env, stat
-from collections import OrderedDict
-from itertools import islice
+from datetime import date, datetime, timezone
+from urllib.parse import urlencode
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from starlette.requests import Request
+import hashlib
+import httpx
 import uvicorn
 import logging
 from app import aiven
+from app import batch as _batch
 from app import basic_types as types
 from app import responses
+from app import metrics
 from app import models
-from app.aiven import accounts as _accounts, cache, projects as _projects, services as _services
-from app.settings import BASEURL
+from app import paging
+from app import render_cache
+from app import serialization
+from app.aiven import accounts as _accounts, cache, catalog as _catalog, client, prefetch, projects as _projects, refresher, \
+    search, services as _services
+from app.settings import BASEURL, BATCH_MAX_REQUESTS, COMPRESSION_MIN_SIZE
 
 logger = logging.getLogger("myapp")
 
@@ -48,6 +56,14 @@ tags_metadata = [
         "name": "Kafka",
         "description": "Kafka service details"
     },
+    {
+        "name": "Pricing",
+        "description": "Price comparisons over the plans and regions of a service type"
+    },
+    {
+        "name": "Batch",
+        "description": "Many GET requests of this API in one round trip"
+    },
     {
         "name": "API stats",
         "description": "Statiscics and metrics of the API itself, such as size of cache."
@@ -55,6 +71,7 @@ tags_metadata = [
 ]
 app = FastAPI(
     title="Aiven API", version="RC-2.0",
+    default_response_class=serialization.FastJSONResponse,
     openapi_tags=tags_metadata,
     description="<p>McDonalds version (ie. not serious draft) of the possible way to split the Aiven API.</p>"
                 "<p>Original API docs at: <a href='https://api.aiven.io/doc/'>https://api.aiven.io/doc/</a></p>"
@@ -66,6 +83,8 @@ app = FastAPI(
                 "</ul>"
 )
 
+app.add_middleware(metrics.MetricsMiddleware)
+
 
 MAIN_NAVI = {
     'docs': f"{BASEURL}{app.docs_url}",
@@ -78,6 +97,22 @@ MAIN_NAVI = {
 }
 
 
+@app.on_event("startup")
+async def start_catalog_refresher():
+    refresher.start()
+
+
+@app.on_event("shutdown")
+async def close_upstream_client():
+    await refresher.stop()
+    await client.close()
+
+
+@app.exception_handler(httpx.TimeoutException)
+async def upstream_timeout(request: Request, exc: httpx.TimeoutException):
+    return JSONResponse(status_code=504, content={"detail": "Upstream Aiven API timed out"})
+
+
 def _get_token(request: Request):
     token = request.headers.get('authorization', None)
     if token:
@@ -86,8 +121,84 @@ def _get_token(request: Request):
         raise HTTPException(status_code=403, detail="No BEARER token")
 
 
+def _etag(request: Request, versions, *extra):
+    """
+    Strong ETag of a response built from upstream payloads of the given versions for this path and query.
+    """
+    digest = hashlib.sha1(request.url.path.encode("utf-8"))
+    for key, value in sorted(request.query_params.multi_items()):
+        digest.update(f"\0{key}={value}".encode("utf-8"))
+    for value in list(sorted(versions)) + list(extra):
+        digest.update(f"\0{value}".encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+
+def _strip_coding(etag):
+    for coding in serialization.COMPRESSORS.keys():
+        if etag.endswith(f'-{coding}"'):
+            return etag[:-len(coding) - 2] + '"'
+    return etag
+
+
+def _variant_headers(etag, coding):
+    """ETag and Vary of the response in the content coding, None for identity"""
+    if coding:
+        etag = f'{etag[:-1]}-{coding}"'
+    return {"ETag": etag, "Vary": "Accept-Encoding"}
+
+
+def _not_modified(request: Request, etag, key, coding):
+    """
+    304 response if the client already has this version (If-None-Match), otherwise None. The 304 has the ETag and
+    Vary the 200 in the negotiated coding would have.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    candidates = [candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates]
+    # ETags of compressed variants have the content coding as suffix, the content is the same
+    matched = next((c for c in candidates if c == "*" or _strip_coding(c) == etag), None)
+    if matched is None:
+        return None
+    if coding is not None:
+        entry = render_cache.rendered.entries.get(key)
+        if entry is not None:
+            compressed = len(entry.body) >= COMPRESSION_MIN_SIZE
+        else:
+            # Without the body at hand: a tag with a coding suffix came from a body large enough to be compressed
+            compressed = _strip_coding(matched) != matched
+        if not compressed:
+            coding = None
+    return Response(status_code=304, headers=_variant_headers(etag, coding))
+
+
+def _rendered(request: Request, etag, build, model=None, token=None):
+    """
+    Response for the ETag: 304 if the client already has it, the cached bytes if it was rendered before, otherwise
+    build() is rendered (validated with model if given) and cached. Private data is cached per token, public data
+    is compressed when cached.
+    """
+    key = (cache.token_hash(token) if token else None, etag)
+    coding = serialization.negotiate(request.headers.get("accept-encoding"))
+    not_modified = _not_modified(request, etag, key, coding)
+    if not_modified:
+        return not_modified
+    entry = render_cache.rendered.get(key)
+    if entry is None:
+        entry = render_cache.render(build(), model)
+        render_cache.rendered.put(key, entry)
+        if token is None:
+            render_cache.rendered.precompress(key, entry)
+    body, coding = render_cache.rendered.encoded(key, entry, coding)
+    headers = _variant_headers(etag, coding)
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(body, media_type="application/json", headers=headers)
+
+
 @app.get("/", response_model=responses.AivenIndexResponse)
-def index():
+async def index():
     return {
         "nav": MAIN_NAVI,
         "service_types": f"{BASEURL}/service_types",
@@ -95,35 +206,64 @@ def index():
     }
 
 @app.get("/api/stats", response_model=responses.ApiStatsResponse, tags=['API stats'])
-def api_stats(request: Request): 
+async def api_stats(request: Request): 
+    catalog = _services.get_loaded_catalog()
     return {
         "private_cache_sessions": cache.get_cache_session_count(),
-        "private_cache_responses": cache.get_cache_response_count()
+        "private_cache_responses": cache.get_cache_response_count(),
+        "private_cache_bytes": cache.get_cache_bytes(),
+        "private_cache_max_bytes": cache.private_sessions.max_bytes,
+        "private_cache_evictions": cache.get_cache_evictions(),
+        "upstream_coalesced": cache.get_coalesced_count(),
+        "catalog_age": refresher.get_catalog_age(),
+        "catalog_last_refresh_at": refresher.stats["last_refresh_at"],
+        "catalog_last_refresh_latency": refresher.stats["last_refresh_latency"],
+        "catalog_refresh_count": refresher.stats["refresh_count"],
+        "catalog_refresh_errors": refresher.stats["refresh_errors"],
+        "catalog_bytes": catalog.nbytes if catalog else None,
+        "catalog_raw_bytes": catalog.raw_bytes if catalog else None,
+        "catalog_shared_objects": catalog.shared_objects if catalog else None,
+        "catalog_pricing_bytes": catalog.pricing.nbytes if catalog else None,
+        "render_cache_entries": len(render_cache.rendered.entries),
+        "render_cache_bytes": render_cache.rendered.bytes,
+        "render_cache_hits": render_cache.rendered.hits,
+        "render_cache_misses": render_cache.rendered.misses,
+        "prefetch_fetched": prefetch.stats["fetched"],
+        "prefetch_skipped": prefetch.stats["skipped"],
+        "prefetch_used": prefetch.stats["used"],
     }
 
 
+@app.get("/metrics", tags=['API stats'])
+async def prometheus_metrics():
+    """
+    Metrics in Prometheus exposition format
+    """
+    body, content_type = metrics.exposition()
+    return Response(body, headers={"Content-Type": content_type})
+
+
 @app.get("/service_types", response_model=responses.ServiceTypeListResponse, tags=["Service type"])
-def service_types():
-    service_types, from_cache = _services.get_service_types()
-    return {
+async def service_types(request: Request):
+    catalog, from_cache = await _services.get_service_catalog()
+    etag = _etag(request, [catalog.version], from_cache)
+    return _rendered(request, etag, lambda: {
         "nav": MAIN_NAVI,
         "from_cache": from_cache,
         'service_types': [
-            {'name': key, 'url': f"{BASEURL}/service_types/{key}"} for key in service_types["service_types"].keys()
+            {'name': key, 'url': f"{BASEURL}/service_types/{key}"} for key in catalog.service_types.keys()
         ]
-    }
+    }, model=responses.ServiceTypeListResponse)
 
 
 @app.get("/service_types/{service_type}", responses=response_codes, tags=["Service type"])
-def service_type(service_type: types.ServiceType):
-    service_types, from_cache = _services.get_service_types()
-    service_types = service_types.get('service_types', {})
-    if service_type.value in service_types:
-        properties = service_types.get(service_type.value)
-    else:
-        raise Exception(f"Unknown service type: {service_type.value}")
+async def service_type(service_type: types.ServiceType, request: Request):
+    catalog, from_cache = await _services.get_service_catalog()
+    entry = _get_service_type(catalog, service_type.value)
+    properties = entry.data
     _plans_base_url = f"{BASEURL}/service_types/{service_type.value}/service_plans/"
-    return {
+    etag = _etag(request, [catalog.version], from_cache)
+    return _rendered(request, etag, lambda: {
         "nav": MAIN_NAVI,
         "from_cache": from_cache,
         "service_type": {
@@ -137,57 +277,92 @@ def service_type(service_type: types.ServiceType):
             "plans": {
                 "url": _plans_base_url,
                 "shortcuts": {
-                    plan.get("service_plan") : {
-                        "url": f"{_plans_base_url}{plan.get('service_plan')}/"
+                    plan_name : {
+                        "url": f"{_plans_base_url}{plan_name}/"
                     }
-                    for plan in properties.get("service_plans")
+                    for plan_name in entry.plans.keys()
                 }
             },
         },
-    }
+    })
 
 
 @app.get("/service_types/{service_type}/versions", responses=response_codes, tags=["Service type"])
-def service_type_versions(service_type):
-    return {
+async def service_type_versions(service_type, request: Request, available: bool = False, eol_before: date = None):
+    """
+    Versions of the service type by major version. available=1 returns only the versions available now,
+    eol_before only the versions reaching Aiven end of life before the date.
+    """
+    available_at = datetime.now(timezone.utc) if available else None
+    with cache.track_versions() as versions:
+        service_versions = await _services.get_service_versions(
+            service_type, available_at=available_at, eol_before=eol_before)
+    # Availability depends on the time, so the selected versions are a part of the ETag
+    etag = _etag(request, versions, *service_versions.keys())
+    return _rendered(request, etag, lambda: {
         "nav": MAIN_NAVI,
         "service_type": {
             "name": service_type,
             "url": f"{BASEURL}/service_types/{service_type}/"
         },
-        "versions": _services.get_service_versions(service_type)
-    }
+        "versions": service_versions
+    })
 
 
 @app.get("/service_types/{service_type}/service_plans", responses=response_codes, tags=["Service type"])
-def service_type_plans(service_type):
-    service_types, from_cache = _services.get_service_types()
-    service_types = service_types.get('service_types', {})
-    plans = {
+async def service_type_plans(service_type, request: Request, where: str = None):
+    """
+    Plans of the service type. where is a filter expression, eg. where=cloud=aws,price_usd<0.1,node_memory_mb>=4096
+    returns the plans available in at least one AWS region under the price and with the memory, and the count of
+    such regions. Fields: cloud, region, plan (=, != or ~ for contains), disk_space_mb, node_memory_mb, price_usd,
+    node_count and max_memory_percent (=, !=, <, <=, >, >=). Alternative values are separated by '|'.
+    """
+    catalog, from_cache = await _services.get_service_catalog()
+    entry = _get_service_type(catalog, service_type)
+    matching = None
+    if where:
+        matching = entry.filter_index.plans(_parse_where(entry.filter_index, where))
+    etag = _etag(request, [catalog.version], from_cache)
+    return _rendered(request, etag, lambda: {
         "nav": MAIN_NAVI,
         "from_cache": from_cache,
         'service_type': {
             'name': service_type,
             'url': f"{BASEURL}/service_types/{service_type}"
         },
+        "filtering": {
+            "is_filtered": where is not None,
+            "where": where,
+        },
         'plans': [
-            {
-                'plan': plan.get('service_plan'),
-                'url': f"{BASEURL}/service_types/{service_type}/service_plans/{plan.get('service_plan')}"
-            }
-            for plan in service_types.get(service_type).get('service_plans') if plan.get('service_plan') != plan
+            _plan_list_item(service_type, plan_name, where, matching)
+            for plan_name in entry.plans.keys()
+            if matching is None or plan_name in matching
         ]
+    })
+
+
+def _plan_list_item(service_type, plan_name, where, matching):
+    item = {
+        'plan': plan_name,
+        'url': f"{BASEURL}/service_types/{service_type}/service_plans/{plan_name}"
     }
-    return plans
+    if matching is not None:
+        item["matching_regions"] = matching[plan_name]
+        item["regions_url"] = f"{item['url']}/regions?{urlencode({'where': where})}"
+    return item
 
 
 @app.get("/service_types/{service_type}/service_plans/{plan}", responses=response_codes, tags=["Service type"])
-def service_type_plan(service_type, plan):
-    service_types, from_cache = _services.get_service_types()
-    service_types = service_types.get('service_types', {})
-    plans = [p for p in service_types.get(service_type).get('service_plans') if p.get('service_plan') == plan]
-    assert len(plans) == 1
-    return {
+async def service_type_plan(service_type, plan, request: Request, fields: str = None):
+    """
+    The plan. fields limits the plan attributes returned, e.g. fields=service_plan,node_count
+    """
+    catalog, from_cache = await _services.get_service_catalog()
+    service_plan = _get_plan(catalog, service_type, plan)
+    plan_fields = _parse_fields(fields, tuple(service_plan.data.keys()))
+    etag = _etag(request, [catalog.version], from_cache)
+    return _rendered(request, etag, lambda: {
         "nav": MAIN_NAVI,
         "from_cache": from_cache,
         'service_type': {
@@ -197,61 +372,70 @@ def service_type_plan(service_type, plan):
         "all_plans": {
             "url": f"{BASEURL}/service_types/{service_type}/service_plans"
         },
-        "plan": plans.pop()
-    }
+        "plan": service_plan.projected(plan_fields)
+    })
 
 
 @app.get("/service_types/{service_type}/service_plans/{plan}/regions", responses=response_codes, tags=["Service plan"])
-def service_plan_regions(service_type, plan, order_by="name", filter: str = None, page: int = None, paginate_by: int = None):
-    if paginate_by:
-        if page is None or int(page) < 1:
-            page = 1
-
-    url = f"{BASEURL}/service_types/{service_type}/service_plans/{plan}/regions?"
-
-    FIELDS = {"id", "disk_space_mb", "price_usd", "node_memory_mb"}
-    service_types, from_cache = _services.get_service_types()
-    service_types = service_types.get('service_types', {})
-    _service_plans = service_types.get(service_type).get('service_plans', {})
-    p = _find_plan(_service_plans, plan)
-
-    regions: dict = p.get("regions", dict())
-    num_regions = len(regions)
-    region_keys = [k for k in regions.keys()]
-
+async def service_plan_regions(service_type, plan, request: Request, order_by="name", filter: str = None,
+                               where: str = None, page: int = None, paginate_by: int = None, cursor: str = None,
+                               fields: str = None):
+    """
+    Regions of the plan. order_by is one of name, disk_space_mb, node_memory_mb or price_usd, prefix with '-' for
+    descending order. filter matches a part of the region name, where is a filter expression as in the plan list,
+    e.g. where=cloud=aws|google,price_usd<0.1. Pages are addressed either with page (starting from 1) or with the
+    cursor returned in the previous page. fields limits the attributes of each region to some of id,
+    disk_space_mb, node_memory_mb and price_usd, e.g. fields=price_usd
+    """
+    url = f"{BASEURL}/service_types/{service_type}/service_plans/{plan}/regions"
+
+    catalog, from_cache = await _services.get_service_catalog()
+    service_plan = _get_plan(catalog, service_type, plan)
+    region_fields = _parse_fields(fields, _catalog.REGION_FIELDS)
+    regions: dict = service_plan.projected_regions(region_fields)
+    matching = None
+    if where:
+        entry = _get_service_type(catalog, service_type)
+        matching = entry.filter_index.regions(plan, _parse_where(entry.filter_index, where))
+    etag = _etag(request, [catalog.version])
+    return _rendered(request, etag, lambda: _regions_page(
+        service_type, plan, url, regions, service_plan.region_index, order_by, filter, where, matching, page,
+        paginate_by, cursor, fields))
+
+
+def _regions_page(service_type, plan, url, regions, region_index, order_by, filter, where, matching, page,
+                  paginate_by, cursor, fields):
     # Filter
-    for region in regions:
-        pass
-
-    # Order
-    ordered_list = OrderedDict()
-    region_keys.sort()      # TODO proper sorting
-    for k in region_keys:
-        ordered_list[k] = regions.get(k)
-
-    # Paginate
-    if paginate_by:
-        def chunks(data):
-            it = iter(data)
-            for i in range(0, len(data), paginate_by):
-                yield {k:data[k] for k in islice(it, paginate_by)}
-
-        paginated = [item for item in chunks(ordered_list)]
-        ordered_list = paginated[page]
+    predicate = None
+    if filter or matching is not None:
+        needle = (filter or "").lower()
+        predicate = lambda region: needle in region.lower() and (matching is None or region in matching)
 
+    # Order and paginate
+    try:
+        result = paging.paginate(region_index, order_by=order_by, predicate=predicate, filter_key=(filter, where),
+                                 page=page, paginate_by=paginate_by, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if result.paginate_by:
+        params = {"order_by": order_by, "filter": filter, "where": where, "fields": fields,
+                  "paginate_by": result.paginate_by}
         meta_pagination = {
             "is_paginated": True,
-            "paginate_by": paginate_by,
-            "page": page,
-            "num_pages": len(paginated),
-            "total_items": num_regions,
-            "prev": pagelink(url, paginate_by, page - 1),
-            "next": pagelink(url, paginate_by, page + 1),
+            "paginate_by": result.paginate_by,
+            "page": result.page,
+            "num_pages": result.num_pages,
+            "total_items": result.total,
+            "next_cursor": result.next_cursor,
+            "prev_cursor": result.prev_cursor,
+            "prev": pagelink(url, params, cursor=result.prev_cursor),
+            "next": pagelink(url, params, cursor=result.next_cursor),
         }
     else:
         meta_pagination = {
             "is_paginated": False,
-            "total_items": num_regions,
+            "total_items": result.total,
         }
 
     return {
@@ -261,8 +445,9 @@ def service_plan_regions(service_type, plan, order_by="name", filter: str = None
                 "this_plan": f"{BASEURL}/service_types/{service_type}/service_plans/{plan}",
             },
             "filtering": {
-                "is_filtered": filter is not None,
-                "filter": filter
+                "is_filtered": filter is not None or where is not None,
+                "filter": filter,
+                "where": where,
             },
             "ordering": {
                 "is_ordered": True,
@@ -270,32 +455,103 @@ def service_plan_regions(service_type, plan, order_by="name", filter: str = None
             },
             "pagination": meta_pagination,
         },
-        "data" : ordered_list
+        "data" : {key: regions[key] for key in result.keys}
     }
 
 
+@app.get("/service_types/{service_type}/pricing/cheapest", responses=response_codes, tags=["Pricing"])
+async def cheapest_plan_by_region(service_type, request: Request, min_memory_mb: float = None):
+    """
+    The cheapest plan of the service type in every region, optionally among the plans with at least
+    min_memory_mb of memory per node
+    """
+    catalog, from_cache = await _services.get_service_catalog()
+    _get_service_type(catalog, service_type)
+    etag = _etag(request, [catalog.version], from_cache)
+    return _rendered(request, etag, lambda: {
+        "nav": MAIN_NAVI,
+        "from_cache": from_cache,
+        "service_type": {"name": service_type, "url": f"{BASEURL}/service_types/{service_type}"},
+        "regions": catalog.pricing.cheapest_by_region(service_type, min_memory_mb=min_memory_mb),
+    })
+
+
+@app.get("/service_types/{service_type}/pricing/price_per_gb", responses=response_codes, tags=["Pricing"])
+async def plan_price_per_gb(service_type, request: Request, region: str = None):
+    """
+    Price per GB of node memory of every plan of the service type over its regions, or in one region, cheapest
+    median first
+    """
+    catalog, from_cache = await _services.get_service_catalog()
+    _get_service_type(catalog, service_type)
+    etag = _etag(request, [catalog.version], from_cache)
+    return _rendered(request, etag, lambda: {
+        "nav": MAIN_NAVI,
+        "from_cache": from_cache,
+        "service_type": {"name": service_type, "url": f"{BASEURL}/service_types/{service_type}"},
+        "region": region,
+        "plans": catalog.pricing.price_per_gb(service_type, region=region),
+    })
+
+
+@app.get("/service_types/{service_type}/pricing/plans", responses=response_codes, tags=["Pricing"])
+async def plan_prices(service_type, request: Request):
+    """
+    Minimum, maximum, median and mean price of every plan of the service type over the regions it is available in
+    """
+    catalog, from_cache = await _services.get_service_catalog()
+    _get_service_type(catalog, service_type)
+    etag = _etag(request, [catalog.version], from_cache)
+    return _rendered(request, etag, lambda: {
+        "nav": MAIN_NAVI,
+        "from_cache": from_cache,
+        "service_type": {"name": service_type, "url": f"{BASEURL}/service_types/{service_type}"},
+        "plans": catalog.pricing.price_stats(service_type),
+    })
+
+
+@app.get("/service_types/{service_type}/service_plans/{plan}/pricing", responses=response_codes, tags=["Pricing"])
+async def plan_pricing(service_type, plan, request: Request):
+    """
+    Minimum, maximum, median and mean price of the plan over the regions it is available in
+    """
+    catalog, from_cache = await _services.get_service_catalog()
+    _get_plan(catalog, service_type, plan)
+    etag = _etag(request, [catalog.version], from_cache)
+    return _rendered(request, etag, lambda: {
+        "nav": MAIN_NAVI,
+        "from_cache": from_cache,
+        "plan": {"name": plan, "url": f"{BASEURL}/service_types/{service_type}/service_plans/{plan}"},
+        "pricing": catalog.pricing.price_stats(service_type, plan=plan).get(plan),
+    })
+
+
 @app.get("/projects", response_model=responses.ProjectListResponse, responses=response_codes, tags=["Project"])
-def projects_list(request: Request):
+async def projects_list(request: Request):
     token = _get_token(request)
     try:
-        projects, from_cache = _projects.get_projects(token=token)
-        return { 
-            "nav": MAIN_NAVI,
-            "from_cache": from_cache,
-            "projects": projects,
-            }
+        with cache.track_versions() as versions:
+            projects, from_cache = await _projects.get_projects(token=token)
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
-    
+    prefetch.schedule(token, [project["project_name"] for project in projects["projects"]])
+    etag = _etag(request, versions, from_cache)
+    return _rendered(request, etag, lambda: {
+        "nav": MAIN_NAVI,
+        "from_cache": from_cache,
+        "projects": projects,
+    }, model=responses.ProjectListResponse, token=token)
+
+
 @app.get("/project/{project}", response_model=models.Project, responses=response_codes, tags=["Project"])
-def project():
+async def project():
     return models.Project()
 
 @app.get("/accounts/", responses=response_codes, tags=["Account"])
-def accounts(request: Request):
+async def accounts(request: Request):
     token = _get_token(request)
     try:
-        accounts, from_cache = _accounts.get_accounts(token)
+        accounts, from_cache = await _accounts.get_accounts(token)
         return {
             'nav': MAIN_NAVI,
             'from_cache': from_cache,
@@ -307,10 +563,10 @@ def accounts(request: Request):
 
 
 @app.get("/accounts/{account_id}/", responses=response_codes, tags=["Account"])
-def account(account_id: str, request: Request):
+async def account(account_id: str, request: Request):
     token = _get_token(request)
     try:
-        account, from_cache = _accounts.get_account(token, account_id)
+        account, from_cache = await _accounts.get_account(token, account_id)
         return {
             'nav': MAIN_NAVI,
             'from_cache': from_cache,
@@ -321,93 +577,401 @@ def account(account_id: str, request: Request):
 
 
 @app.get("/accounts/{account}/projects/{project}/", responses=response_codes, tags=["Account"])
-def account_project(account: str, project: str, request: Request):
+async def account_project(account: str, project: str, request: Request):
     raise HTTPException(status_code=501, detail=f"Not implemented. Account: {account}, Project: {project}")
 
 
 @app.get("/project/{project}/services", response_model=models.ServiceLightList, responses=response_codes,
          tags=["Project"])
-def project_service_list(project):
+async def project_service_list(project):
     """List of services of this project"""
     return models.ServiceLightList()
 
 
 @app.get("/services", responses=response_codes, tags=["Service"])
-def services(request: Request, project=None):
+async def services(request: Request, project=None, stream: bool = False, q: str = None, prefix: bool = False,
+                   service_type: str = None, state: str = None):
+    """
+    Services of the project, or of all projects. With stream=1 or "Accept: application/x-ndjson" the services are
+    sent as newline delimited JSON as soon as each project has been fetched, followed by a summary record.
+
+    q searches service names over all projects, by substring or with prefix=1 by prefix. service_type and state
+    filter the services, also together with project. Searches are answered from an index of the user's services
+    that is refreshed in the background; index_age in the summary tells how old it is in seconds.
+    """
     token = _get_token(request)
-    if project:
-        response = _services.get_services(token=token, projects=[project, ])
-    else:
-        response = _services.get_services(token=token)
+    if q or service_type or state:
+        return await _search_services(token, q, prefix, project, service_type, state)
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        return await _stream_services(token, project)
+    with cache.track_versions() as versions:
+        if project:
+            service_list, errors = await _services.get_services(token=token, projects=[project, ])
+        else:
+            service_list, errors = await _services.get_services(token=token)
+    etag = _etag(request, versions, *[error["project"] for error in errors])
+    return _rendered(request, etag, lambda: {
+        'navi': MAIN_NAVI,
+        'summary': {
+            'service_count' : len(service_list),
+            'is_partial': len(errors) > 0,
+            'failed_projects': errors,
+        },
+        'services': service_list
+    }, token=token)
+
+async def _search_services(token, q, prefix, project, service_type, state):
+    try:
+        index = await search.get_index(token)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    records = index.search(q, prefix=prefix, project=project, service_type=service_type, state=state)
+    errors = list(index.errors.values())
+    service_list = []
+    for record in records:
+        item = _services.service_list_item(record["project"], record["name"])
+        item["service"].update({
+            "service_type": record["service_type"],
+            "state": record["state"],
+            "plan": record["plan"],
+            "cloud_name": record["cloud_name"],
+        })
+        service_list.append(item)
     return {
         'navi': MAIN_NAVI,
-        'summary': { 'service_count' : len(response)},
-        'services': response
+        'summary': {
+            'service_count': len(service_list),
+            'is_partial': len(errors) > 0,
+            'failed_projects': errors,
+            'index_age': index.age,
+            'index_updated_at': index.updated_at,
+        },
+        'services': service_list
     }
 
+
+async def _stream_services(token, project):
+    if project:
+        projects = [project, ]
+    else:
+        try:
+            projects = await _services.get_project_names(token)
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    async def _records():
+        service_count = 0
+        errors = []
+        async for _, service_list, error in _services.iter_services(token, projects):
+            if error:
+                errors.append(error)
+            for item in service_list:
+                service_count += 1
+                yield serialization.dumps(item) + b"\n"
+        yield serialization.dumps({
+            'summary': {
+                'service_count': service_count,
+                'is_partial': len(errors) > 0,
+                'failed_projects': errors,
+            }
+        }) + b"\n"
+
+    return StreamingResponse(_records(), media_type="application/x-ndjson")
+
+
 @app.get("/services/{service_name}", response_model=models.Service, responses=response_codes, tags=["Service"])
-def service(service_name):
+async def service(service_name, request: Request, project: str = None):
     """
     Detailed service resource. Any endpoint returning potentially large list of items need to requested separately
-    and can be paginated.
+    and can be paginated. Without project the service is looked up from all projects of the user.
+    """
+    token = _get_token(request)
+    with cache.track_versions() as versions:
+        snapshot, _ = await _get_service_snapshot(token, service_name, project)
+        catalog, _ = await _services.get_service_catalog()
+    etag = _etag(request, versions, snapshot.project)
+    return _rendered(request, etag, lambda: _service_detail(snapshot, catalog), model=models.Service, token=token)
+
+
+def _service_links(snapshot):
+    base_url = f"{BASEURL}/service/{snapshot.name}"
+    query = f"?{urlencode({'project': snapshot.project})}"
+    links = {
+        "self": {"href": f"{BASEURL}/services/{snapshot.name}{query}"},
+        "integrations": {"href": f"{base_url}/integrations{query}"},
+        "databases": {"href": f"{base_url}/databases{query}"},
+        "backups": {"href": f"{base_url}/backups{query}"},
+        "users": {"href": f"{base_url}/users{query}"},
+    }
+    if snapshot.service_type == "kafka":
+        links["service_details"] = {"href": f"{base_url}/kafka{query}", "title": "Kafka"}
+    return links
+
+
+def _service_detail(snapshot, catalog):
+    data = snapshot.data
+    user = snapshot.primary_user
+    entry = catalog.get_service_type(snapshot.service_type)
+    connection_info = data.get("connection_info") or {}
+    maintenance = data.get("maintenance") or {}
+    return {
+        "service_name": snapshot.name,
+        "service_type": snapshot.service_type,
+        "service_type_description": (entry.data.get("description") if entry else None) or "",
+        "service_state": data.get("state"),
+        "connections": {
+            "credentials": {"username": user.get("username"), "password": user.get("password")},
+            "primary_connection": {
+                "service_uri": data.get("service_uri"),
+                "service_uri_params": data.get("service_uri_params") or {},
+                "connection_type": "primary",
+            },
+            "replicas": [
+                {"service_uri": connection_info["replica_uri"], "connection_type": "replica"}
+            ] if connection_info.get("replica_uri") else [],
+        },
+        "cloud": {"name": data.get("cloud_name"), "description": data.get("cloud_description")},
+        "plan": {
+            "name": data.get("plan"),
+            "node_count": data.get("node_count"),
+            "node_cpu_count": data.get("node_cpu_count"),
+            "node_memory_mb": data.get("node_memory_mb"),
+        },
+        "network": {"vpc_id": data.get("project_vpc_id")},
+        "maintenance": {
+            "dow": maintenance.get("dow"),
+            "time": maintenance.get("time"),
+            "pending_updates": [
+                {
+                    "description": update.get("description"),
+                    "deadline": update.get("deadline"),
+                    "start_after": update.get("start_after"),
+                    "automatic_start_at": update.get("start_at"),
+                }
+                for update in maintenance.get("updates") or []
+            ],
+        },
+        "metadata": data.get("metadata") or {},
+        "notifications": data.get("service_notifications") or [],
+        "features": sorted(name for name, enabled in (data.get("features") or {}).items() if enabled),
+        "created_at": data.get("create_time"),
+        "_links": _service_links(snapshot),
+    }
+
+
+async def _service_resource(request: Request, service_name, project, build, model):
+    """
+    Response of a sub-resource endpoint of the service, build(snapshot) returns its content
     """
-    return models.Service()
+    token = _get_token(request)
+    with cache.track_versions() as versions:
+        snapshot, _ = await _get_service_snapshot(token, service_name, project)
+    etag = _etag(request, versions, snapshot.project)
+    return _rendered(request, etag, lambda: build(snapshot), model=model, token=token)
 
 
 @app.get("/service/{service_name}/backups", response_model=models.BackupList, responses=response_codes, tags=["Service"])
-def service_backups(service_name: models.ServiceName):
+async def service_backups(service_name: models.ServiceName, request: Request, project: str = None,
+                          page: int = None, paginate_by: int = None):
     """
-    Available backups for the service
+    Available backups for the service, newest first
     """
-    return models.BackupList()
+    def _build(snapshot):
+        backups, pagination = _page(snapshot.backups, page, paginate_by)
+        return {**pagination, "backups": backups}
+    return await _service_resource(request, service_name, project, _build, models.BackupList)
 
 
 @app.get("/service/{service_name}/databases", response_model=models.DatabaseList, responses=response_codes, tags=["Service"])
-def service_databases(service_name: models.ServiceName):
+async def service_databases(service_name: models.ServiceName, request: Request, project: str = None,
+                            page: int = None, paginate_by: int = None):
     """
-    Available backups for the service
+    Databases of the service
     """
-    return models.DatabaseList()
+    def _build(snapshot):
+        databases, pagination = _page(snapshot.databases, page, paginate_by)
+        return {**pagination, "items": databases}
+    return await _service_resource(request, service_name, project, _build, models.DatabaseList)
 
 
 @app.get("/service/{service_name}/users", response_model=models.ServiceUserList, responses=response_codes, tags=["Service"])
-def service_users(service_name: models.ServiceName):
+async def service_users(service_name: models.ServiceName, request: Request, project: str = None,
+                        page: int = None, paginate_by: int = None):
     """
     Users of the service
     """
-    return models.ServiceUserList()
+    def _build(snapshot):
+        users, pagination = _page(snapshot.users, page, paginate_by)
+        return {**pagination, "items": users}
+    return await _service_resource(request, service_name, project, _build, models.ServiceUserList)
 
 
 @app.get("/service/{service_name}/integrations", response_model=models.ServiceIntegrationsList, responses=response_codes, tags=["Service"])
-def service_integrations(service_name: models.ServiceName):
+async def service_integrations(service_name: models.ServiceName, request: Request, project: str = None,
+                               page: int = None, paginate_by: int = None):
     """
-    Users of the service
+    Integrations of the service
     """
-    return models.ServiceIntegrationsList()
+    def _endpoint(name, project):
+        if not name:
+            return None
+        return {"name": name, "href": f"{BASEURL}/services/{name}?{urlencode({'project': project})}"}
+
+    def _build(snapshot):
+        integrations, pagination = _page(snapshot.integrations, page, paginate_by)
+        return {**pagination, "items": [
+            {
+                "integration_type": integration["integration_type"],
+                "active": integration["active"],
+                "source_endpoint": _endpoint(integration["source_service"], snapshot.project),
+                "target_endpoint": _endpoint(integration["dest_service"], snapshot.project),
+            }
+            for integration in integrations
+        ]}
+    return await _service_resource(request, service_name, project, _build, models.ServiceIntegrationsList)
 
 
 @app.get("/service/{service_name}/kafka", response_model=models.Kafka, responses=response_codes, tags=["Kafka"])
-def kafka_service(service_name: models.ServiceName):
+async def kafka_service(service_name: models.ServiceName, request: Request, project: str = None):
     """
     Kafka specific service data
     """
-    return models.Kafka()
+    def _build(snapshot):
+        if snapshot.service_type != "kafka":
+            raise HTTPException(status_code=404, detail=f"{service_name} is not a Kafka service")
+        links = _service_links(snapshot)
+        query = f"?{urlencode({'project': snapshot.project})}"
+        return {
+            "kafka_version": (snapshot.data.get("user_config") or {}).get("kafka_version"),
+            "topic_count": len(snapshot.topics),
+            "_links": {
+                "self": links["service_details"],
+                "parent": links["self"],
+                "topics": {"href": f"{BASEURL}/service/{snapshot.name}/kafka/topics{query}"},
+            },
+        }
+    return await _service_resource(request, service_name, project, _build, models.Kafka)
 
 
 @app.get("/service/{service_name}/kafka/topics", response_model=models.KafkaTopics, responses=response_codes, tags=["Kafka"])
-def kafka_topics(service_name: models.ServiceName):
-    return models.KafkaTopics()
+async def kafka_topics(service_name: models.ServiceName, request: Request, project: str = None, order_by="name",
+                       prefix: str = None, filter: str = None, page: int = None, paginate_by: int = None,
+                       cursor: str = None):
+    """
+    Topics of the Kafka service. prefix matches the start of the topic name, filter any part of it. order_by is
+    one of name, partitions, replication, retention_hours, min_insync_replicas or state, prefix with '-' for
+    descending order. Pages are addressed with page or with the cursor of the previous page.
+    """
+    token = _get_token(request)
+    with cache.track_versions() as versions:
+        snapshot, topic_index = await _get_topic_index(token, service_name, project)
+    etag = _etag(request, versions, snapshot.project)
+    return _rendered(request, etag, lambda: _topics_page(
+        topic_index, order_by, prefix, filter, page, paginate_by, cursor), model=models.KafkaTopics, token=token)
+
+
+def _topics_page(topic_index, order_by, prefix, filter, page, paginate_by, cursor):
+    predicate = None
+    if filter:
+        needle = filter.lower()
+        predicate = lambda topic: needle in topic.lower()
+    if paginate_by is None:
+        paginate_by = paging.DEFAULT_PAGE_SIZE
+    try:
+        result = paging.paginate(topic_index.index, order_by=order_by, predicate=predicate, filter_key=filter,
+                                 page=page, paginate_by=paginate_by, cursor=cursor, prefix=prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    topics = topic_index.topics
+    return {
+        "page": result.page,
+        "prev": result.page - 1 if result.page and result.page > 1 else None,
+        "next": result.page + 1 if result.page and result.page < result.num_pages else None,
+        "count": result.total,
+        "page_count": result.num_pages,
+        "next_cursor": result.next_cursor,
+        "prev_cursor": result.prev_cursor,
+        "topics": [{**topics[name], "links": {}} for name in result.keys],
+    }
+
+
+@app.post("/batch", tags=["Batch"])
+async def batch(request: Request, body: responses.BatchRequest):
+    """
+    GET requests to the other routes, given as paths ("/service_types/pg") or as path and params, run concurrently.
+    The responses are returned in the same order, each with its path, status code and body. The authorization
+    header of the batch is used for all of them.
+    """
+    if len(body.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} requests in a batch")
+    requests = [
+        (item, None) if isinstance(item, str) else (item.path, item.params) for item in body.requests
+    ]
+    content = await _batch.run(request.app, request.scope, requests)
+    headers = {"Vary": "Accept-Encoding"}
+    coding = serialization.negotiate(request.headers.get("accept-encoding"))
+    if coding and len(content) >= COMPRESSION_MIN_SIZE:
+        content = serialization.compress(content, coding)
+        headers["Content-Encoding"] = coding
+    return Response(content, media_type="application/json", headers=headers)
+
+
+def _get_service_type(catalog, service_type):
+    entry = catalog.get_service_type(service_type)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Unknown service type: {service_type}")
+    return entry
+
+
+def _get_plan(catalog, service_type, plan):
+    _get_service_type(catalog, service_type)
+    service_plan = catalog.get_plan(service_type, plan)
+    if service_plan is None:
+        raise HTTPException(status_code=404, detail=f"Unknown plan {plan} for service type {service_type}")
+    return service_plan
+
+
+async def _get_service_snapshot(token, service_name, project):
+    try:
+        return await _services.get_service_snapshot(token, service_name, project=project)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
-def _find_plan(_service_plans, plan):
-    plans = [p for p in _service_plans if p.get('service_plan') == plan]
-    assert len(plans) == 1
-    p = plans.pop()
-    return p
+async def _get_topic_index(token, service_name, project):
+    try:
+        return await _services.get_topic_index(token, service_name, project=project)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def _page(items, page, paginate_by):
+    try:
+        return paging.paginate_list(items, page=page, paginate_by=paginate_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _parse_where(filter_index, where):
+    try:
+        return filter_index.parse(where)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _parse_fields(fields, allowed):
+    try:
+        return _catalog.parse_fields(fields, allowed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-def pagelink(url, paginate_by, page_num):
-    return f"{url}&paginate_by={paginate_by}&page={page_num}"
+def pagelink(url, params, cursor):
+    if cursor is None:
+        return None
+    query = {key: value for key, value in params.items() if value is not None}
+    query["cursor"] = cursor
+    return f"{url}?{urlencode(query)}"
 
 
 def main():
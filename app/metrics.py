@@ -0,0 +1,150 @@
+"""
+Prometheus metrics of the API: upstream latency and rate limiting, cache efficiency and request latency per route.
+"""
+import time
+from urllib.parse import urlsplit
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.routing import Match
+
+
+UPSTREAM_LATENCY = Histogram(
+    "aiven_upstream_request_seconds",
+    "Latency of Aiven API calls",
+    ["endpoint", "status"],
+)
+CACHE_REQUESTS = Counter(
+    "aiven_cache_requests_total",
+    "Lookups of upstream responses in the cache",
+    ["cache", "result"],
+)
+UPSTREAM_COALESCED = Counter(
+    "aiven_upstream_coalesced_total",
+    "Upstream calls not made because an identical call was already in flight",
+    ["cache"],
+)
+CACHE_BYTES = Gauge(
+    "aiven_cache_bytes",
+    "Bytes held by the caches",
+    ["cache"],
+)
+UPSTREAM_QUEUE_DEPTH = Gauge(
+    "aiven_upstream_queue_depth",
+    "Aiven API calls waiting for the rate limits",
+    ["priority"],
+)
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "aiven_upstream_queue_wait_seconds",
+    "Time Aiven API calls waited for the rate limits",
+    ["priority"],
+)
+UPSTREAM_RETRIES = Counter(
+    "aiven_upstream_retries_total",
+    "Aiven API calls retried, by the reason of the retry",
+    ["endpoint", "reason"],
+)
+PREFETCH = Counter(
+    "aiven_prefetch_total",
+    "Prefetched upstream responses: fetched, skipped (already cached), used (served a later request)",
+    ["result"],
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of API requests, until the last byte of the response",
+    ["route", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "API requests being handled",
+    ["route"],
+)
+
+# Path segments following these name a resource, they are replaced to keep the label cardinality low
+_NAMED_SEGMENTS = {"project": "{project}", "account": "{account_id}", "service": "{service_name}", "topic": "{topic}"}
+
+
+def upstream_endpoint(url):
+    """
+    Aiven API path template of the url, eg. /v1/project/{project}/service
+    """
+    segments = urlsplit(url).path.split("/")
+    for i in range(1, len(segments)):
+        if segments[i - 1] in _NAMED_SEGMENTS and segments[i]:
+            segments[i] = _NAMED_SEGMENTS[segments[i - 1]]
+    return "/".join(segments)
+
+
+def observe_upstream(url, status, seconds):
+    UPSTREAM_LATENCY.labels(upstream_endpoint(url), str(status)).observe(seconds)
+
+
+def observe_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def observe_coalesced(cache):
+    UPSTREAM_COALESCED.labels(cache).inc()
+
+
+def track_cache_bytes(cache, function):
+    CACHE_BYTES.labels(cache).set_function(function)
+
+
+def observe_prefetch(result):
+    PREFETCH.labels(result).inc()
+
+
+def track_queue_depth(priority, function):
+    UPSTREAM_QUEUE_DEPTH.labels(priority).set_function(function)
+
+
+def observe_queue_wait(priority, seconds):
+    UPSTREAM_QUEUE_WAIT.labels(priority).observe(seconds)
+
+
+def observe_retry(url, reason):
+    UPSTREAM_RETRIES.labels(upstream_endpoint(url), str(reason)).inc()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency and in-flight requests per route. The route label is the path template,
+    so it stays bounded whatever the path parameters are.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route(self, scope):
+        router = scope["app"].router
+        for route in router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = self._route(scope)
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(route, scope["method"], str(status["code"])).observe(time.perf_counter() - start)
+
+
+def exposition():
+    return generate_latest(), CONTENT_TYPE_LATEST
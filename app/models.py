@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 from enum import Enum
 from pydantic import BaseModel, AnyUrl, Field
@@ -12,9 +12,9 @@ class AivenBaseModel(BaseModel):
 
 
 class PaginatedAivenBaseModel(AivenBaseModel):
-    page: int = Field(description="Current page number")
-    prev: int = Field(description="Previous page")
-    next: int = Field(description="Next page")
+    page: Optional[int] = Field(description="Current page number, none for pages addressed with a cursor")
+    prev: Optional[int] = Field(description="Previous page, none on the first page")
+    next: Optional[int] = Field(description="Next page, none on the last page")
     count: int = Field(description="Total count of items")
     page_count: int = Field(description="Total count of pages available")
 
@@ -35,6 +35,7 @@ class ServiceType(Enum):
     grafana = "grafana"
     influxdb = "influxdb"
     elasticsearch = "elasticsearch"
+    opensearch = "opensearch"
     kafka_connect = "kafka_connect"
     kafka_mirrormaker = "kafka_mirrormaker"
 
@@ -52,12 +53,12 @@ class Clouds(Enum):
 
 
 class Cloud(BaseModel):
-    name: Clouds
-    description: str
+    name: str = Field(description="Cloud region, eg. google-europe-north1")
+    description: Optional[str]
 
 
 class Network(BaseModel):
-    vpc_id: str
+    vpc_id: Optional[str]
 
 
 class NodesUrl(AnyUrl):
@@ -66,15 +67,15 @@ class NodesUrl(AnyUrl):
 
 class Plan(BaseModel):
     name: str
-    node_count: int
-    node_cpu_count: int
-    node_memory_mb : int
-    nodes: NodesUrl
+    node_count: Optional[int]
+    node_cpu_count: Optional[int]
+    node_memory_mb : Optional[int]
+    nodes: Optional[NodesUrl]
 
 
 class Credentials(BaseModel):
-    username: str
-    password: str
+    username: Optional[str]
+    password: Optional[str]
 
 
 class ConnectionType(Enum):
@@ -83,8 +84,8 @@ class ConnectionType(Enum):
 
 
 class Connection(BaseModel):
-    service_uri: AnyUrl
-    service_uri_params: str
+    service_uri: str = Field(description="URI of the service, host:port for some service types")
+    service_uri_params: Dict[str, Any] = {}
     connection_type: ConnectionType
 
 
@@ -96,14 +97,14 @@ class Connections(BaseModel):
 
 class Update(BaseModel):
     description: str
-    deadline: datetime
-    start_after: datetime
-    automatic_start_at: datetime
+    deadline: Optional[datetime]
+    start_after: Optional[datetime]
+    automatic_start_at: Optional[datetime]
 
 
 class Maintenance(BaseModel):
-    dow: str
-    time: datetime
+    dow: Optional[str]
+    time: Optional[str] = Field(description="Start of the maintenance window, UTC time of day")
     pending_updates: List[Update] = []
 
 
@@ -146,9 +147,9 @@ class ServiceLightList(PaginatedAivenBaseModel):
 
 class Service(AivenBaseModel):
     service_name: ServiceName = Field(description="Name of the service, may or may not be same as in URL")
-    service_type: ServiceType = Field(description="Service type")
+    service_type: str = Field(description="Service type, eg. pg or kafka")
     service_type_description: str
-    service_state: ServiceState = Field(description="Overall state of the service")
+    service_state: str = Field(description="Overall state of the service, eg. RUNNING or REBUILDING")
     connections: Connections = Field(description="Connection strings and credentials")
     cloud: Cloud
     plan: Plan
@@ -194,7 +195,9 @@ class DatabaseList(PaginatedAivenBaseModel):
 
 
 class ServiceUserListItem(BaseModel):
-    pass
+    username: str
+    type: Optional[str]
+    authentication: Optional[str]
 
 
 class ServiceUserList(PaginatedAivenBaseModel):
@@ -213,9 +216,10 @@ class Endpoint(BaseModel):
 
 
 class ServiceIntegrationsListItem(BaseModel):
-    integration_type = IntegrationType
-    target_endpoint = Endpoint
-    source_endpoint = Endpoint
+    integration_type: str = Field(description="Eg. one of IntegrationType")
+    active: Optional[bool]
+    target_endpoint: Optional[Endpoint]
+    source_endpoint: Optional[Endpoint]
 
 
 class ServiceIntegrationsList(PaginatedAivenBaseModel):
@@ -223,25 +227,34 @@ class ServiceIntegrationsList(PaginatedAivenBaseModel):
 
 
 class KafkaTopicLinks(BaseModel):
-    messages: Link
+    messages: Optional[Link]
 
 
 class KafkaTopic(BaseModel):
     name: str
+    partitions: Optional[int]
+    replication: Optional[int]
+    retention_hours: Optional[int]
+    min_insync_replicas: Optional[int]
+    state: Optional[str]
     links: KafkaTopicLinks
 
 
 class KafkaTopics(PaginatedAivenBaseModel):
+    next_cursor: Optional[str] = Field(description="Cursor of the next page, stable while topics are added")
+    prev_cursor: Optional[str] = Field(description="Cursor of the previous page")
     topics: List[KafkaTopic]
 
 
 class KafkaServiceLinks(BaseModel):
     self: Link
     parent: Link
-    acl: Link
-    connectors: Link
+    acl: Optional[Link]
+    connectors: Optional[Link]
     topics: Link
 
 
 class Kafka(AivenBaseModel):
+    kafka_version: Optional[str]
+    topic_count: int
     links: KafkaServiceLinks = Field(alias="_links")
\ No newline at end of file
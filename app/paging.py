@@ -0,0 +1,243 @@
+"""
+Server side ordering and pagination over dicts of records, eg. the regions of a service plan.
+
+Keys are sorted once per ordering field when the index is built. Fetching a page is then a bisect plus a slice,
+whether the page is addressed by number or by a cursor token.
+"""
+import base64
+import json
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 1000
+
+
+def _sort_values(values):
+    """
+    Comparable sort values of a field: numbers when all values are numeric (upstream sends prices as strings,
+    eg. "0.0300"), otherwise strings. Missing values go last.
+    """
+    try:
+        return [_number(value) for value in values]
+    except (TypeError, ValueError):
+        return [_string(value) for value in values]
+
+
+def _number(value):
+    return float("inf") if value is None else float(value)
+
+
+def _string(value):
+    return "\uffff" if value is None else str(value)
+
+
+class SortedKeys:
+    """
+    Keys of records, pre-sorted by every ordering field. Ties are broken by the key, so the order is stable and
+    every (value, key) pair is unique.
+    """
+
+    MAX_FILTERED_VIEWS = 64
+    MAX_UPDATE_RATIO = 0.25    # Larger diffs are applied by sorting again
+
+    def __init__(self, records, fields, key_name="name"):
+        self.records = records
+        self.key_name = key_name
+        self.order_fields = tuple(fields)
+        self._sort()
+
+    def _sort(self):
+        records = self.records
+        self.ascending = {self.key_name: [(key, key) for key in sorted(records.keys())]}
+        for field in self.order_fields:
+            values = _sort_values([record.get(field) for record in records.values()])
+            self.ascending[field] = sorted(zip(values, records.keys()))
+        self._filtered = OrderedDict()    # (field, filter) -> rows, most recently used last
+
+    @property
+    def fields(self):
+        return list(self.ascending.keys())
+
+    def _row(self, field, key, record):
+        if field == self.key_name:
+            return key, key
+        rows = self.ascending[field]
+        value = record.get(field)
+        if rows and isinstance(rows[0][0], float):
+            return _number(value), key
+        return _string(value), key
+
+    def update(self, changed, removed=()):
+        """
+        Applies a diff: changed maps keys to their new or changed records, removed lists the keys of deleted
+        records. Only the rows of those keys move, unless the diff is a large part of the records.
+        """
+        if len(changed) + len(removed) > len(self.records) * self.MAX_UPDATE_RATIO:
+            for key in removed:
+                self.records.pop(key, None)
+            self.records.update(changed)
+            self._sort()
+            return
+        try:
+            for key in list(removed) + list(changed.keys()):
+                record = self.records.pop(key, None)
+                if record is None:
+                    continue
+                for field, rows in self.ascending.items():
+                    del rows[bisect_left(rows, self._row(field, key, record))]
+            for key, record in changed.items():
+                self.records[key] = record
+                for field, rows in self.ascending.items():
+                    insort(rows, self._row(field, key, record))
+        except (TypeError, ValueError):
+            # A value does not fit the type the field was sorted by, eg. a string in a numeric field. The records
+            # are partly updated at this point: apply the whole diff to them and sort again.
+            for key in removed:
+                self.records.pop(key, None)
+            self.records.update(changed)
+            self._sort()
+            return
+        self._filtered.clear()
+
+    def rows(self, field, predicate=None, filter_key=None, prefix=None):
+        """
+        Sorted (value, key) rows of the field. When a predicate of the key is given, only matching rows are returned;
+        the result is remembered under filter_key so paging through a filtered list does not rescan it. A prefix
+        limits the rows to keys starting with it, found by bisection when ordered by the key.
+        """
+        if prefix:
+            if field == self.key_name and predicate is None:
+                rows = self.ascending[field]
+                return rows[bisect_left(rows, (prefix,)):bisect_left(rows, (prefix + "\uffff",))]
+            matches = predicate
+            predicate = lambda key: key.startswith(prefix) and (matches is None or matches(key))
+            filter_key = (prefix, filter_key) if matches is None or filter_key is not None else None
+        rows = self.ascending[field]
+        if predicate is None:
+            return rows
+        cache_key = (field, filter_key)
+        if filter_key is not None and cache_key in self._filtered:
+            self._filtered.move_to_end(cache_key)
+            return self._filtered[cache_key]
+        filtered = [row for row in rows if predicate(row[1])]
+        if filter_key is not None:
+            self._filtered[cache_key] = filtered
+            if len(self._filtered) > self.MAX_FILTERED_VIEWS:
+                self._filtered.popitem(last=False)
+        return filtered
+
+
+class Page:
+    def __init__(self, keys, total, paginate_by, page=None, next_cursor=None, prev_cursor=None):
+        self.keys = keys
+        self.total = total
+        self.paginate_by = paginate_by
+        self.page = page
+        self.num_pages = -(-total // paginate_by) if paginate_by else 1
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def parse_order(order_by, fields):
+    descending = order_by.startswith("-")
+    field = order_by[1:] if descending else order_by
+    if field not in fields:
+        raise ValueError(f"Cannot order by '{field}', available fields: {', '.join(fields)}")
+    return field, descending
+
+
+def encode_cursor(order_by, row, forward=True):
+    payload = json.dumps({"o": order_by, "r": list(row), "f": forward}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, order_by):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        row, forward = tuple(payload["r"]), payload["f"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if payload.get("o") != order_by:
+        raise ValueError("Cursor was created for a different ordering")
+    return row, forward
+
+
+def _page_size(paginate_by):
+    """paginate_by limited to MAX_PAGE_SIZE, DEFAULT_PAGE_SIZE when not given. Raises ValueError below 1."""
+    if paginate_by is None:
+        return DEFAULT_PAGE_SIZE
+    if paginate_by < 1:
+        raise ValueError("paginate_by must be positive")
+    return min(paginate_by, MAX_PAGE_SIZE)
+
+
+def paginate(index, order_by="name", predicate=None, filter_key=None, page=None, paginate_by=None, cursor=None,
+             prefix=None):
+    """
+    One page of keys from a SortedKeys index. order_by is a field name, prefixed with '-' for descending order.
+    Pages are addressed either by page number (1-based) or by a cursor from a previous Page. Without either
+    all keys are returned.
+    """
+    field, descending = parse_order(order_by, index.fields)
+    rows = index.rows(field, predicate, filter_key, prefix=prefix)
+    total = len(rows)
+
+    if cursor is None and page is None and paginate_by is None:
+        ordered = reversed(rows) if descending else rows
+        return Page([key for _, key in ordered], total, None)
+
+    paginate_by = _page_size(paginate_by)
+    # Work on positions of the ascending rows, a descending page is the mirrored slice
+    if cursor is not None:
+        row, forward = decode_cursor(cursor, order_by)
+        try:
+            if forward != descending:
+                start = bisect_right(rows, row)
+                end = min(start + paginate_by, total)
+            else:
+                end = bisect_left(rows, row)
+                start = max(end - paginate_by, 0)
+        except TypeError:
+            raise ValueError("Invalid cursor")
+        page = None
+    else:
+        page = max(page or 1, 1)
+        offset = (page - 1) * paginate_by
+        if descending:
+            end = max(total - offset, 0)
+            start = max(end - paginate_by, 0)
+        else:
+            start = min(offset, total)
+            end = min(start + paginate_by, total)
+
+    selected = rows[start:end]
+    if descending:
+        selected = selected[::-1]
+    has_before, has_after = start > 0, end < total
+    if descending:
+        has_before, has_after = has_after, has_before
+    next_cursor = encode_cursor(order_by, selected[-1], forward=True) if selected and has_after else None
+    prev_cursor = encode_cursor(order_by, selected[0], forward=False) if selected and has_before else None
+    return Page([key for _, key in selected], total, paginate_by, page, next_cursor, prev_cursor)
+
+
+def paginate_list(items, page=None, paginate_by=None):
+    """
+    One page of a list, numbered from 1. Returns (items of the page, fields of PaginatedAivenBaseModel).
+    """
+    paginate_by = _page_size(paginate_by)
+    page = page or 1
+    total = len(items)
+    page_count = max(-(-total // paginate_by), 1)
+    if page < 1 or page > page_count:
+        raise ValueError(f"Page {page} does not exist, there are {page_count} pages")
+    start = (page - 1) * paginate_by
+    return items[start:start + paginate_by], {
+        "page": page,
+        "prev": page - 1 if page > 1 else None,
+        "next": page + 1 if page < page_count else None,
+        "count": total,
+        "page_count": page_count,
+    }
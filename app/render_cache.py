@@ -0,0 +1,86 @@
+"""
+Final JSON bytes of responses, keyed by the ETag of the response (route, query and upstream payload versions) and
+the token hash for private data. A hit skips building, validating and serializing the response.
+
+Compressed variants are kept next to the JSON bytes so a hit is not compressed again.
+"""
+from collections import OrderedDict
+
+from fastapi.encoders import jsonable_encoder
+
+from app import metrics, serialization, settings
+
+
+class Rendered:
+    def __init__(self, body):
+        self.body = body
+        self.variants = {}    # content coding -> compressed body
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(variant) for variant in self.variants.values())
+
+
+class RenderCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # key -> Rendered, least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        metrics.observe_cache("rendered", entry is not None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous.size
+        if entry.size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.bytes += entry.size
+        self._evict()
+
+    def encoded(self, key, entry, coding):
+        """
+        Body of the entry in the content coding, None for identity. Small bodies are not compressed.
+        Returns (body, coding actually used).
+        """
+        if coding is None or len(entry.body) < settings.COMPRESSION_MIN_SIZE:
+            return entry.body, None
+        if coding not in entry.variants:
+            entry.variants[coding] = serialization.compress(entry.body, coding)
+            if self.entries.get(key) is entry:
+                self.bytes += len(entry.variants[coding])
+                self._evict()
+        return entry.variants[coding], coding
+
+    def precompress(self, key, entry):
+        for coding in serialization.COMPRESSORS.keys():
+            self.encoded(key, entry, coding)
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self.entries:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= evicted.size
+
+
+def render(content, model=None):
+    """
+    Same output as FastAPI's response_model validation and JSON serialization.
+    """
+    if model is not None:
+        content = jsonable_encoder(model.parse_obj(content), by_alias=True)
+    return Rendered(serialization.dumps(content))
+
+
+rendered = RenderCache(settings.RENDER_CACHE_MAX_BYTES)
+metrics.track_cache_bytes("rendered", lambda: rendered.bytes)
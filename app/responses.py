@@ -1,5 +1,5 @@
 from pydantic import BaseModel, AnyUrl, Field
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Union
 from app import basic_types as types
 from app.aiven import projects
 
@@ -29,6 +29,35 @@ class ProjectListResponse(BaseModel):
     #projects: List[types.ProjectListItem]
 
 
+class BatchItem(BaseModel):
+    path: str = Field(description="Path of a GET route of this API, can include a query")
+    params: Optional[Dict[str, Any]] = Field(description="Query parameters added to the path")
+
+
+class BatchRequest(BaseModel):
+    requests: List[Union[str, BatchItem]]
+
+
 class ApiStatsResponse(BaseModel):
     private_cache_sessions: int = Field(description="Size of the internal cache (sessions)")
-    private_cache_responses: int = Field(description="Count of individual responses in the cache")
\ No newline at end of file
+    private_cache_responses: int = Field(description="Count of individual responses in the cache")
+    private_cache_bytes: int = Field(description="Bytes of cached responses, summed over all sessions")
+    private_cache_max_bytes: int = Field(description="Byte budget of the cache, sessions are evicted above it")
+    private_cache_evictions: Dict[str, int] = Field(description="Count of evicted sessions by reason: idle, lru, bytes")
+    upstream_coalesced: int = Field(description="Upstream calls saved by joining an identical call in flight")
+    catalog_age: Optional[float] = Field(description="Seconds since the service types catalog was fetched from upstream")
+    catalog_last_refresh_at: Optional[float] = Field(description="UNIX time of the last background catalog refresh")
+    catalog_last_refresh_latency: Optional[float] = Field(description="Duration of the last background catalog refresh, seconds")
+    catalog_refresh_count: int = Field(description="Successful background catalog refreshes")
+    catalog_refresh_errors: int = Field(description="Failed background catalog refreshes, the previous copy was kept")
+    catalog_bytes: Optional[int] = Field(description="Bytes of the service types catalog as kept, strings interned and equal region data shared")
+    catalog_raw_bytes: Optional[int] = Field(description="Bytes of the same catalog as decoded from upstream, compare to catalog_bytes")
+    catalog_shared_objects: Optional[int] = Field(description="Distinct region and config objects the catalog data was deduplicated to")
+    catalog_pricing_bytes: Optional[int] = Field(description="Bytes of the columnar pricing table of the catalog")
+    render_cache_entries: int = Field(description="Rendered responses kept as JSON bytes")
+    render_cache_bytes: int = Field(description="Size of the rendered responses")
+    render_cache_hits: int = Field(description="Responses served from the rendered bytes")
+    render_cache_misses: int = Field(description="Responses that had to be built and serialized")
+    prefetch_fetched: int = Field(description="Service lists prefetched after /projects")
+    prefetch_skipped: int = Field(description="Service lists not prefetched because they were cached already")
+    prefetch_used: int = Field(description="Prefetched service lists that served a request, compare to fetched")
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+JSON serialization and content coding of response bodies.
+
+The serializer is picked with JSON_SERIALIZER: orjson when it is installed, the standard json module otherwise.
+Bodies of at least COMPRESSION_MIN_SIZE bytes are compressed with brotli or gzip, as negotiated from
+Accept-Encoding. brotli is used only when the Brotli package is installed.
+"""
+import gzip
+import json
+from logging import getLogger
+
+from fastapi.responses import JSONResponse
+
+from app import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = getLogger("serialization")
+
+
+def _json_dumps(content):
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_dumps(content):
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+SERIALIZERS = {"json": _json_dumps}
+if orjson is not None:
+    SERIALIZERS["orjson"] = _orjson_dumps
+
+if settings.JSON_SERIALIZER in SERIALIZERS:
+    dumps = SERIALIZERS[settings.JSON_SERIALIZER]
+else:
+    logger.warning(f"JSON serializer {settings.JSON_SERIALIZER} is not available, using json")
+    dumps = _json_dumps
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=6)}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+
+PREFERENCE = ["br", "gzip"]    # When the client accepts both equally
+
+
+def negotiate(accept_encoding):
+    """
+    Best available content coding accepted by the client, None for identity.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    candidates = [
+        coding for coding in PREFERENCE
+        if coding in COMPRESSORS and accepted.get(coding, accepted.get("*", 0.0)) > 0
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda coding: accepted.get(coding, accepted.get("*", 0.0)))
+
+
+def compress(body, coding):
+    return COMPRESSORS[coding](body)
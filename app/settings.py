@@ -4,3 +4,65 @@ from os import environ as env
 HOST = env.get("HOST", "localhost")
 PORT = env.get("PORT", "8000")
 BASEURL = env.get("BASEURL", f"http://{HOST}:{PORT}")
+AIVEN_API_URL = env.get("AIVEN_API_URL", "https://api.aiven.io")
+
+# Upstream (Aiven API) connection pool and timeouts, in seconds
+UPSTREAM_TIMEOUT = float(env.get("UPSTREAM_TIMEOUT", "10"))
+UPSTREAM_CONNECT_TIMEOUT = float(env.get("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_MAX_CONNECTIONS = int(env.get("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(env.get("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(env.get("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+
+# Upstream rate limits, requests per second and burst size, in total and per token (0 = no limit). 429 and 5xx
+# responses are retried UPSTREAM_MAX_RETRIES times with jittered backoff from UPSTREAM_RETRY_BACKOFF seconds; a
+# Retry-After longer than UPSTREAM_MAX_RETRY_WAIT seconds is not waited for.
+UPSTREAM_RATE = float(env.get("UPSTREAM_RATE", "50"))
+UPSTREAM_BURST = int(env.get("UPSTREAM_BURST", "100"))
+UPSTREAM_TOKEN_RATE = float(env.get("UPSTREAM_TOKEN_RATE", "10"))
+UPSTREAM_TOKEN_BURST = int(env.get("UPSTREAM_TOKEN_BURST", "20"))
+UPSTREAM_MAX_RETRIES = int(env.get("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_RETRY_BACKOFF = float(env.get("UPSTREAM_RETRY_BACKOFF", "0.2"))
+UPSTREAM_MAX_RETRY_WAIT = float(env.get("UPSTREAM_MAX_RETRY_WAIT", "10"))
+
+# How many projects are fetched concurrently when listing services of all projects
+SERVICES_FANOUT_CONCURRENCY = int(env.get("SERVICES_FANOUT_CONCURRENCY", "8"))
+
+# Limits of the per-token session cache: session count, idle time (seconds) and bytes of cached responses
+PRIVATE_CACHE_MAX_SESSIONS = int(env.get("PRIVATE_CACHE_MAX_SESSIONS", "1000"))
+PRIVATE_CACHE_IDLE_TIMEOUT = float(env.get("PRIVATE_CACHE_IDLE_TIMEOUT", "900"))
+PRIVATE_CACHE_MAX_BYTES = int(env.get("PRIVATE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Opt-in prefetch of the service lists of all projects after /projects, at most PREFETCH_CONCURRENCY upstream calls
+# at a time over all tokens
+PREFETCH_SERVICES = env.get("PREFETCH_SERVICES", "0").lower() in ("1", "true", "yes")
+PREFETCH_CONCURRENCY = int(env.get("PREFETCH_CONCURRENCY", "4"))
+
+# Seconds between background refreshes of the per-token service search index
+SEARCH_INDEX_REFRESH_INTERVAL = float(env.get("SEARCH_INDEX_REFRESH_INTERVAL", "60"))
+
+# Parsed service objects (and Kafka topic indexes) kept per token for the service detail endpoints, dropped with
+# the token's cache session
+SERVICE_SNAPSHOT_MAX = int(env.get("SERVICE_SNAPSHOT_MAX", "100"))
+
+# Public catalog (service types and versions): seconds until a cached copy is refreshed in the background, and
+# interval of the scheduled refresh (0 disables it, stale copies are then refreshed on first use)
+CATALOG_MAX_AGE = float(env.get("CATALOG_MAX_AGE", "600"))
+CATALOG_REFRESH_INTERVAL = float(env.get("CATALOG_REFRESH_INTERVAL", "300"))
+
+# Bytes of rendered JSON responses kept in memory
+RENDER_CACHE_MAX_BYTES = int(env.get("RENDER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Response serialization: "orjson" (used when installed) or "json", and the smallest body that is compressed
+JSON_SERIALIZER = env.get("JSON_SERIALIZER", "orjson")
+COMPRESSION_MIN_SIZE = int(env.get("COMPRESSION_MIN_SIZE", "1024"))
+
+# Cache backend: "memory", or "sqlite" to persist cached responses in CACHE_PATH, shared by the workers of a host.
+# Private responses are encrypted with a key derived from the token and CACHE_SECRET, and kept on disk for
+# CACHE_PERSIST_PRIVATE_MAX_AGE seconds.
+CACHE_BACKEND = env.get("CACHE_BACKEND", "memory")
+CACHE_PATH = env.get("CACHE_PATH", "pagingtest_cache.sqlite")
+CACHE_SECRET = env.get("CACHE_SECRET", "")
+CACHE_PERSIST_PRIVATE_MAX_AGE = float(env.get("CACHE_PERSIST_PRIVATE_MAX_AGE", "3600"))
+
+# POST /batch: most sub-requests in one batch
+BATCH_MAX_REQUESTS = int(env.get("BATCH_MAX_REQUESTS", "50"))
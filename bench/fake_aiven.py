@@ -0,0 +1,241 @@
+"""
+Local stand-in for the Aiven API, serving generated fixtures for the endpoints app.aiven uses.
+
+    uvicorn bench.fake_aiven:app --port 8001
+
+Size and latency come from the environment:
+    FAKE_SERVICE_TYPES          number of service types (default 13, all of basic_types.ServiceType)
+    FAKE_PLANS                  plans per service type (default 20)
+    FAKE_REGIONS                regions per plan (default 100)
+    FAKE_PROJECTS               projects per token (default 40)
+    FAKE_SERVICES_PER_PROJECT   services per project (default 10)
+    FAKE_TOPICS                 topics of each Kafka service (default 500)
+    FAKE_LATENCY_MS             added latency of every response (default 50)
+    FAKE_LATENCY_JITTER_MS      random extra latency, 0..jitter (default 20)
+"""
+import asyncio
+import hashlib
+import json
+import random
+from os import environ as env
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+from app import basic_types
+
+
+SERVICE_TYPES = int(env.get("FAKE_SERVICE_TYPES", str(len(basic_types.ServiceType))))
+PLANS = int(env.get("FAKE_PLANS", "20"))
+REGIONS = int(env.get("FAKE_REGIONS", "100"))
+PROJECTS = int(env.get("FAKE_PROJECTS", "40"))
+SERVICES_PER_PROJECT = int(env.get("FAKE_SERVICES_PER_PROJECT", "10"))
+TOPICS = int(env.get("FAKE_TOPICS", "500"))
+LATENCY_MS = float(env.get("FAKE_LATENCY_MS", "50"))
+LATENCY_JITTER_MS = float(env.get("FAKE_LATENCY_JITTER_MS", "20"))
+
+CLOUDS = ["aws", "google", "azure", "do", "upcloud"]
+AREAS = ["europe", "us", "asia", "south-america", "africa", "oceania"]
+PLAN_TIERS = [("hobbyist", 1), ("startup", 4), ("business", 8), ("premium", 16)]
+
+_random = random.Random(42)    # Same fixtures on every run
+
+
+REGION_NAMES = [f"{CLOUDS[i % len(CLOUDS)]}-{AREAS[(i // len(CLOUDS)) % len(AREAS)]}-{i}" for i in range(REGIONS)]
+
+
+def _plan(service_type, index):
+    tier, size = PLAN_TIERS[index % len(PLAN_TIERS)]
+    memory = size * 1024 * (1 + index // len(PLAN_TIERS))
+    return {
+        "service_plan": f"{tier}-{memory // 1024}" if tier != "hobbyist" else f"hobbyist-{index}",
+        "service_type": service_type,
+        "node_count": 1 if tier in ("hobbyist", "startup") else 3,
+        "max_memory_percent": 80,
+        "backup_config": {"interval": 24, "max_count": 2, "recovery_mode": "pitr"},
+        "regions": {
+            region: {
+                "disk_space_mb": memory * 20,
+                "node_memory_mb": memory,
+                "price_usd": f"{memory / 4096 * _random.uniform(0.05, 0.2):.4f}",
+            }
+            for region in REGION_NAMES
+        },
+    }
+
+
+def _service_types():
+    service_types = {}
+    for service_type in list(basic_types.ServiceType)[:SERVICE_TYPES]:
+        service_types[service_type.value] = {
+            "description": f"{service_type.value} - managed by the fake Aiven API",
+            "latest_available_version": "14",
+            "default_version": "13",
+            "service_plans": [_plan(service_type.value, i) for i in range(PLANS)],
+        }
+    return {"service_types": service_types}
+
+
+def _service_versions():
+    versions = []
+    for service_type in list(basic_types.ServiceType)[:SERVICE_TYPES]:
+        for major in range(9, 15):
+            versions.append({
+                "service_type": service_type.value,
+                "major_version": str(major),
+                "state": "available" if major > 10 else "unavailable",
+                "availability_start_time": f"20{major + 7}-01-01T00:00:00Z",
+                "availability_end_time": f"20{major + 12}-01-01T00:00:00Z",
+                "aiven_end_of_life_time": f"20{major + 12}-06-01T00:00:00Z",
+                "upstream_end_of_life_time": f"20{major + 12}-01-01T00:00:00Z",
+                "end_of_life_help_article_url": "https://help.aiven.io/",
+                "termination_time": None,
+            })
+    return {"service_versions": versions}
+
+
+def _projects():
+    return {
+        "projects": [
+            {
+                "project_name": f"project-{i}",
+                "tenant_id": "aiven",
+                "account_id": f"a{i % 3}",
+                "account_name": f"Account {i % 3}",
+                "billing_group_id": f"bg{i % 3}",
+                "billing_group_name": f"Billing group {i % 3}",
+            }
+            for i in range(PROJECTS)
+        ]
+    }
+
+
+def _accounts():
+    return {"accounts": [{"account_id": f"a{i}", "account_name": f"Account {i}"} for i in range(3)]}
+
+
+def _services(project):
+    service_types = [service_type.value for service_type in list(basic_types.ServiceType)[:SERVICE_TYPES]]
+    return {
+        "services": [
+            {
+                "service_name": f"{project}-svc-{i}",
+                "service_type": service_types[i % len(service_types)],
+                "state": "RUNNING",
+                "plan": "startup-4",
+                "cloud_name": REGION_NAMES[i % len(REGION_NAMES)],
+            }
+            for i in range(SERVICES_PER_PROJECT)
+        ]
+    }
+
+
+def _service(project, service_name):
+    """Full service object, None for services the project does not have"""
+    services = {service["service_name"]: service for service in _services(project)["services"]}
+    if service_name not in services:
+        return None
+    service = dict(services[service_name])
+    index = int(service_name.rsplit("-", 1)[-1])
+    host = f"{service_name}-{project}.aivencloud.com"
+    service.update({
+        "cloud_description": f"{service['cloud_name']} - fake cloud",
+        "project_vpc_id": None,
+        "node_count": 1,
+        "node_cpu_count": 2,
+        "node_memory_mb": 4096,
+        "disk_space_mb": 81920,
+        "create_time": "2021-01-01T00:00:00Z",
+        "service_uri": f"{service['service_type']}://avnadmin:secret@{host}:12691/defaultdb",
+        "service_uri_params": {"host": host, "port": "12691", "user": "avnadmin", "password": "secret"},
+        "connection_info": {},
+        "maintenance": {"dow": "sunday", "time": "04:00:00", "updates": []},
+        "features": {"enhanced_logging": True, "pg_stat_monitor_enable": False},
+        "metadata": {},
+        "service_notifications": [],
+        "user_config": {"kafka_version": "3.0"} if service["service_type"] == "kafka" else {},
+        "users": [{"username": "avnadmin", "password": "secret", "type": "primary"}] + [
+            {"username": f"user-{i}", "password": "secret", "type": "normal"} for i in range(20)
+        ],
+        "databases": ["defaultdb"] + [f"db-{i}" for i in range(index * 3)],
+        "backups": [
+            {"backup_name": f"backup-{day}", "backup_time": f"2021-06-{day:02}T00:00:00Z", "data_size": 1024 * day}
+            for day in range(1, 29)
+        ],
+        "service_integrations": [
+            {
+                "integration_type": "metrics",
+                "source_service": service_name,
+                "dest_service": f"{project}-svc-0",
+                "active": True,
+            }
+        ],
+        "topics": [
+            {"topic_name": f"topic-{i}", "partitions": 3, "replication": 2, "retention_hours": 168, "state": "ACTIVE"}
+            for i in range(TOPICS)
+        ] if service["service_type"] == "kafka" else [],
+    })
+    return {"service": service}
+
+
+def _encoded(document):
+    body = json.dumps(document).encode("utf-8")
+    return body, f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+FIXTURES = {
+    "service_types": _encoded(_service_types()),
+    "service_versions": _encoded(_service_versions()),
+    "projects": _encoded(_projects()),
+    "accounts": _encoded(_accounts()),
+}
+
+app = FastAPI(title="Fake Aiven API")
+
+
+async def _respond(request: Request, fixture):
+    delay = LATENCY_MS + _random.uniform(0, LATENCY_JITTER_MS)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+    body, etag = fixture
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+@app.get("/v1/service_types")
+async def service_types(request: Request):
+    return await _respond(request, FIXTURES["service_types"])
+
+
+@app.get("/v1/service_versions")
+async def service_versions(request: Request):
+    return await _respond(request, FIXTURES["service_versions"])
+
+
+@app.get("/v1/project")
+async def projects(request: Request):
+    return await _respond(request, FIXTURES["projects"])
+
+
+@app.get("/v1/account")
+async def accounts(request: Request):
+    return await _respond(request, FIXTURES["accounts"])
+
+
+@app.get("/v1/account/{account_id}")
+async def account(account_id: str, request: Request):
+    return await _respond(request, _encoded({"account": {"account_id": account_id, "account_name": account_id}}))
+
+
+@app.get("/v1/project/{project}/service")
+async def project_services(project: str, request: Request):
+    return await _respond(request, _encoded(_services(project)))
+
+
+@app.get("/v1/project/{project}/service/{service_name}")
+async def project_service(project: str, service_name: str, request: Request):
+    service = _service(project, service_name)
+    if service is None:
+        return Response(status_code=404, content=b'{"message": "Service does not exist"}', media_type="application/json")
+    return await _respond(request, _encoded(service))
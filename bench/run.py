@@ -0,0 +1,234 @@
+"""
+Benchmark of app.main:app against the fake Aiven API (bench/fake_aiven.py).
+
+    python -m bench.run --concurrency 1 10 50 --requests 200 --output bench_output.json
+    python -m bench.run --compare bench_baseline.json --tolerance 0.25
+
+Both servers are started as uvicorn subprocesses. Cold figures are the latencies of the first requests to a
+freshly started API, so every sample meets empty caches: for every route and concurrency level the API is
+started --cold-samples times and sent one round of `concurrency` simultaneous requests. Warm figures come from
+--requests requests to an API that has answered the route once already. Results are written as JSON, one object
+per (route, cache, concurrency) with throughput and p50/p99 latency. With --compare the results are checked
+against a previous output and the exit code is 1 if any route got slower than the tolerance allows.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+TOKEN = "aivenv1 benchmark-token"
+
+# Route template -> path requested (or method, path and JSON body), for every route in app/main.py that serves data
+ROUTES = {
+    "/": "/",
+    "/service_types": "/service_types",
+    "/service_types/{service_type}": "/service_types/pg",
+    "/service_types/{service_type}/versions": "/service_types/pg/versions",
+    "/service_types/{service_type}/service_plans": "/service_types/pg/service_plans",
+    "/service_types/{service_type}/service_plans/{plan}": "/service_types/pg/service_plans/startup-4",
+    "/service_types/{service_type}/service_plans/{plan}/regions":
+        "/service_types/pg/service_plans/startup-4/regions?order_by=price_usd&paginate_by=20&page=2",
+    "/service_types/{service_type}/pricing/cheapest": "/service_types/pg/pricing/cheapest?min_memory_mb=8192",
+    "/service_types/{service_type}/pricing/price_per_gb": "/service_types/pg/pricing/price_per_gb",
+    "/service_types/{service_type}/pricing/plans": "/service_types/pg/pricing/plans",
+    "/service_types/{service_type}/service_plans/{plan}/pricing": "/service_types/pg/service_plans/startup-4/pricing",
+    "/projects": "/projects",
+    "/accounts/": "/accounts/",
+    "/accounts/{account_id}/": "/accounts/a1/",
+    "/services": "/services",
+    "/services?project=": "/services?project=project-1",
+    "/services?q=": "/services?q=svc-1&service_type=pg",
+    "/services/{service_name}": "/services/project-1-svc-0?project=project-1",
+    "/services/{service_name} (project lookup)": "/services/project-39-svc-4",
+    "/service/{service_name}/backups": "/service/project-1-svc-0/backups?project=project-1&paginate_by=10",
+    "/service/{service_name}/databases": "/service/project-1-svc-3/databases?project=project-1&paginate_by=5",
+    "/service/{service_name}/users": "/service/project-1-svc-0/users?project=project-1",
+    "/service/{service_name}/integrations": "/service/project-1-svc-0/integrations?project=project-1",
+    "/service/{service_name}/kafka": "/service/project-1-svc-0/kafka?project=project-1",
+    "/service/{service_name}/kafka/topics":
+        "/service/project-1-svc-0/kafka/topics?project=project-1&prefix=topic-1&order_by=-partitions&paginate_by=50",
+    "POST /batch": ("POST", "/batch", {"requests": [
+        "/service_types/pg",
+        "/projects",
+        {"path": "/services", "params": {"project": "project-2"}},
+        {"path": "/services/project-2-svc-1", "params": {"project": "project-2"}},
+    ]}),
+}
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def _measure(base_url, target, requests, concurrency):
+    """Latencies (seconds), error count and elapsed seconds of requests sent by concurrency workers"""
+    method, path, body = ("GET", target, None) if isinstance(target, str) else target
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(path)
+
+    async with httpx.AsyncClient(base_url=base_url, headers={"authorization": TOKEN}, timeout=60) as client:
+        async def _worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, json=body)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[_worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    return latencies, errors, elapsed
+
+
+def _summary(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def _start(module, port, env):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env},
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/openapi.json", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"{module} did not start on port {port}")
+
+
+def _stop(process):
+    process.terminate()
+    process.wait(timeout=10)
+
+
+def run(args):
+    results = []
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    api_env = {"AIVEN_API_URL": fake_url, "BASEURL": api_url, "CACHE_BACKEND": "memory"}
+    fake = _start("bench.fake_aiven:app", args.fake_port, {})
+    try:
+        for route, target in ROUTES.items():
+            if args.routes and route not in args.routes:
+                continue
+            for concurrency in args.concurrency:
+                # Cold: one round of simultaneous first requests per freshly started API
+                latencies, errors, elapsed = [], 0, 0.0
+                for _ in range(args.cold_samples):
+                    api = _start("app.main:app", args.api_port, api_env)
+                    try:
+                        sample = asyncio.run(_measure(api_url, target, concurrency, concurrency))
+                    finally:
+                        _stop(api)
+                    latencies += sample[0]
+                    errors += sample[1]
+                    elapsed += sample[2]
+                _report(results, route, "cold", concurrency, _summary(latencies, errors, elapsed))
+
+                # Warm: the route has been answered once, its upstream responses are cached
+                api = _start("app.main:app", args.api_port, api_env)
+                try:
+                    asyncio.run(_measure(api_url, target, 1, 1))
+                    result = _summary(*asyncio.run(_measure(api_url, target, args.requests, concurrency)))
+                finally:
+                    _stop(api)
+                _report(results, route, "warm", concurrency, result)
+    finally:
+        _stop(fake)
+    return results
+
+
+def _report(results, route, cache_state, concurrency, result):
+    result.update({"route": route, "cache": cache_state, "concurrency": concurrency})
+    results.append(result)
+    print(
+        f"{route:62} {cache_state:4} c={concurrency:<4} {result['throughput_rps']:>9} rps "
+        f"p50 {result['p50_ms']:>9} ms  p99 {result['p99_ms']:>9} ms  errors {result['errors']}",
+        file=sys.stderr,
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Routes whose p99 latency or throughput got worse than the tolerance (a fraction) allows"""
+    previous = {(r["route"], r["cache"], r["concurrency"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["route"], result["cache"], result["concurrency"]))
+        if before is None:
+            continue
+        if result["p99_ms"] > before["p99_ms"] * (1 + tolerance) or \
+                result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append({"before": before, "after": result})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per warm run")
+    parser.add_argument("--cold-samples", type=int, default=5, help="API restarts per cold measurement")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--routes", nargs="*", help="route templates to run, default all")
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--fake-port", type=int, default=8101)
+    parser.add_argument("--output", help="file for the JSON results, default stdout")
+    parser.add_argument("--compare", help="previous JSON results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, fraction")
+    args = parser.parse_args()
+
+    results = run(args)
+    document = {"created_at": time.time(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            before, after = regression["before"], regression["after"]
+            print(
+                f"REGRESSION {after['route']} {after['cache']} c={after['concurrency']}: "
+                f"p99 {before['p99_ms']} -> {after['p99_ms']} ms, "
+                f"{before['throughput_rps']} -> {after['throughput_rps']} rps",
+                file=sys.stderr,
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
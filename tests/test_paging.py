@@ -0,0 +1,176 @@
+import pytest
+
+from app import paging
+
+
+def _index():
+    # region-00 .. region-29, the price goes down as the number goes up, pairs of regions share a price
+    records = {
+        f"region-{i:02}": {"price_usd": f"{(30 - i) // 2 / 100:.4f}", "node_memory_mb": 4096}
+        for i in range(30)
+    }
+    return paging.SortedKeys(records, ("price_usd", "node_memory_mb"))
+
+
+def _walk(index, cursor=None, backwards=False, **kwargs):
+    """Keys of all pages reached by following the cursors from the first page (or the given cursor)"""
+    pages = []
+    while True:
+        page = paging.paginate(index, cursor=cursor, **kwargs)
+        pages.append(page.keys)
+        cursor = page.prev_cursor if backwards else page.next_cursor
+        if cursor is None:
+            return pages
+
+
+def test_unpaginated_returns_all_keys_in_order():
+    page = paging.paginate(_index(), order_by="-name")
+    assert page.keys == [f"region-{i:02}" for i in reversed(range(30))]
+    assert page.total == 30
+    assert page.num_pages == 1
+
+
+def test_ascending_pages():
+    index = _index()
+    first = paging.paginate(index, page=1, paginate_by=7)
+    last = paging.paginate(index, page=5, paginate_by=7)
+    assert first.keys == [f"region-{i:02}" for i in range(7)]
+    assert last.keys == ["region-28", "region-29"]
+    assert first.num_pages == last.num_pages == 5
+    assert first.prev_cursor is None and first.next_cursor is not None
+    assert last.next_cursor is None and last.prev_cursor is not None
+
+
+def test_descending_pages():
+    index = _index()
+    first = paging.paginate(index, order_by="-name", page=1, paginate_by=7)
+    last = paging.paginate(index, order_by="-name", page=5, paginate_by=7)
+    assert first.keys == [f"region-{i:02}" for i in range(29, 22, -1)]
+    assert last.keys == ["region-01", "region-00"]
+    assert first.prev_cursor is None
+    assert last.next_cursor is None
+
+
+def test_ordered_by_value_breaks_ties_by_key():
+    page = paging.paginate(_index(), order_by="price_usd", page=1, paginate_by=4)
+    assert page.keys == ["region-29", "region-27", "region-28", "region-25"]
+
+
+def test_page_past_the_end_is_empty():
+    page = paging.paginate(_index(), page=9, paginate_by=7)
+    assert page.keys == []
+    assert page.next_cursor is None and page.prev_cursor is None
+
+
+@pytest.mark.parametrize("order_by", ["name", "-name", "price_usd", "-price_usd"])
+def test_cursors_forward_cover_all_pages(order_by):
+    index = _index()
+    everything = paging.paginate(index, order_by=order_by).keys
+    pages = _walk(index, order_by=order_by, paginate_by=7)
+    assert [len(keys) for keys in pages] == [7, 7, 7, 7, 2]
+    assert sum(pages, []) == everything
+    assert pages == [paging.paginate(index, order_by=order_by, page=n, paginate_by=7).keys for n in range(1, 6)]
+
+
+@pytest.mark.parametrize("order_by", ["name", "-name", "price_usd", "-price_usd"])
+def test_cursors_back_return_the_previous_pages(order_by):
+    index = _index()
+    last = paging.paginate(index, order_by=order_by, page=5, paginate_by=7)
+    pages = _walk(index, cursor=last.prev_cursor, backwards=True, order_by=order_by, paginate_by=7)
+    expected = [paging.paginate(index, order_by=order_by, page=n, paginate_by=7).keys for n in range(4, 0, -1)]
+    assert pages == expected
+
+
+def test_cursor_survives_removed_key():
+    index = _index()
+    first = paging.paginate(index, page=1, paginate_by=5)
+    index.update({}, removed=["region-05"])
+    second = paging.paginate(index, cursor=first.next_cursor, paginate_by=5)
+    assert second.keys == ["region-06", "region-07", "region-08", "region-09", "region-10"]
+
+
+def test_update_with_value_of_another_type_keeps_all_records():
+    # state is None everywhere, so it is sorted as a numeric column until a string arrives
+    records = {f"t{i:03}": {"partitions": i, "state": None} for i in range(100)}
+    index = paging.SortedKeys(records, ("partitions", "state"))
+    index.update({
+        "t001": {"partitions": 1, "state": "ACTIVE"},
+        "t002": {"partitions": 200, "state": None},
+        "t003": {"partitions": 300, "state": None},
+    }, removed=["t004"])
+    assert len(index.records) == 99
+    assert "t004" not in index.records
+    page = paging.paginate(index, order_by="-partitions", page=1, paginate_by=2)
+    assert page.keys == ["t003", "t002"]
+    page = paging.paginate(index, order_by="state", page=1, paginate_by=1)
+    assert page.keys == ["t001"]
+    assert page.total == 99
+
+
+def test_filtered_view():
+    index = _index()
+    matches = lambda key: key.endswith("5")
+    page = paging.paginate(index, predicate=matches, filter_key="5", page=1, paginate_by=2)
+    assert page.total == 3
+    assert page.keys == ["region-05", "region-15"]
+    rest = paging.paginate(index, predicate=matches, filter_key="5", cursor=page.next_cursor, paginate_by=2)
+    assert rest.keys == ["region-25"]
+    assert rest.next_cursor is None
+
+
+def test_filtered_view_is_remembered_until_update():
+    index = _index()
+    paging.paginate(index, predicate=lambda key: key.endswith("5"), filter_key="5", page=1)
+    # Same filter_key: the remembered rows are used, the predicate is not called again
+    page = paging.paginate(index, predicate=lambda key: False, filter_key="5", page=1)
+    assert page.total == 3
+    index.update({"region-35": {"price_usd": "0.0100", "node_memory_mb": 4096}})
+    page = paging.paginate(index, predicate=lambda key: key.endswith("5"), filter_key="5", page=1)
+    assert page.keys == ["region-05", "region-15", "region-25", "region-35"]
+
+
+def test_prefix():
+    index = _index()
+    assert paging.paginate(index, prefix="region-1", page=1, paginate_by=3).keys == [
+        "region-10", "region-11", "region-12"]
+    page = paging.paginate(index, order_by="-price_usd", prefix="region-2", page=1, paginate_by=20)
+    assert page.total == 10
+    assert page.keys[0] == "region-20"
+
+
+@pytest.mark.parametrize("paginate_by", [0, -3])
+def test_invalid_page_size(paginate_by):
+    with pytest.raises(ValueError):
+        paging.paginate(_index(), page=1, paginate_by=paginate_by)
+    with pytest.raises(ValueError):
+        paging.paginate_list(list(range(30)), page=1, paginate_by=paginate_by)
+
+
+def test_page_size_is_capped():
+    page = paging.paginate(_index(), page=1, paginate_by=paging.MAX_PAGE_SIZE + 1)
+    assert page.paginate_by == paging.MAX_PAGE_SIZE
+
+
+def test_invalid_order_field():
+    with pytest.raises(ValueError):
+        paging.paginate(_index(), order_by="-disk_space_mb", page=1)
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30", paging.encode_cursor("name", (1, 2, 3))])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        paging.paginate(_index(), cursor=cursor, paginate_by=5)
+
+
+def test_cursor_of_another_ordering():
+    cursor = paging.paginate(_index(), order_by="price_usd", page=1, paginate_by=5).next_cursor
+    with pytest.raises(ValueError):
+        paging.paginate(_index(), order_by="-price_usd", cursor=cursor, paginate_by=5)
+
+
+def test_paginate_list():
+    items, pagination = paging.paginate_list(list(range(45)), page=3, paginate_by=20)
+    assert items == list(range(40, 45))
+    assert pagination == {"page": 3, "prev": 2, "next": None, "count": 45, "page_count": 3}
+    with pytest.raises(ValueError):
+        paging.paginate_list(list(range(45)), page=4, paginate_by=20)